@@ -1,13 +1,18 @@
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
 from ..core.database import engine
 from ..core.init_db import init_all
+from ..core.process_pool import conversion_pool
+from ..core.rag.qdrant_db import QdrantUnavailableError
+from ..core.rag.vector_store import get_vector_store
 from .chat import router as chat_router
 from .file import router as file_router
 from .login import router as login_router
 from .permission import router as permission_router
+from .retrieval import router as retrieval_router
 from .role import router as role_router
 from .user import router as user_router
 
@@ -15,7 +20,11 @@ from .user import router as user_router
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_all()
+    vector_store = get_vector_store()
+    vector_store.start()
     yield
+    await vector_store.close()
+    conversion_pool.shutdown()
     await engine.dispose()
 
 
@@ -32,8 +41,30 @@ app.include_router(role_router)
 app.include_router(permission_router)
 app.include_router(file_router)
 app.include_router(chat_router)
+app.include_router(retrieval_router)
+
+
+@app.exception_handler(QdrantUnavailableError)
+async def qdrant_unavailable(request: Request, exc: QdrantUnavailableError):
+    """Qdrant重连期间依赖向量库的请求返回503，客户端可以稍后重试"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 
 @app.get("/")
 def root():
     return {"message": "welcome to Knowledge Base Assistant API"}
+
+
+@app.get("/ready")
+def ready():
+    """就绪探针，向量库（如Qdrant集合）初始化完成前返回503"""
+    vector_store = get_vector_store()
+    if not vector_store.ready:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "not ready",
+                vector_store.name: vector_store.last_error,
+            },
+        )
+    return {"status": "ready"}
@@ -5,15 +5,20 @@ import openai
 import os
 from dotenv import load_dotenv
 
-from ..dependencies.security import get_current_user
+from ..dependencies.security import get_current_user, require_permission
 from ..dependencies.depends import get_db
 from ..models.user import User
 from ..schemas.chat_history import ChatHistoryCreate
+from ..schemas.retrieval import RetrievalOptions
 from ..core.database import SessionLocal
 from ..services.crud import chat_history as chat_history_crud
 from ..services.crud.knowledge_item import get_knowledge_items_by_user
 from ..core.rag.embedding import EmbeddingModel
-from ..core.rag.qdrant_db import qdrant_client, QDRANT_COLLECTION_NAME
+from ..core.rag.tokenizer import estimate_tokens
+from ..core.scheduler import embedding_scheduler, llm_scheduler
+from ..core.rag.embedding_cache import get_embedding_cache, query_embedding_cache
+from ..core.rag.qdrant_db import QdrantUnavailableError, resolve_option
+from ..core.rag.vector_store import get_vector_store
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy import insert
@@ -29,7 +34,7 @@ OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL")
 
 if OPENAI_API_KEY:
-    client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+    client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 else:
     client = None
 
@@ -37,6 +42,7 @@ else:
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    retrieval: Optional[RetrievalOptions] = None
 
 
 class ChatResponse(BaseModel):
@@ -60,7 +66,9 @@ async def chat_completion(
         )
 
         # 使用用户查询向量数据库获取相关上下文
-        context = await _retrieve_context_from_qdrant(request.message, current_user.id)
+        context = await _retrieve_context_from_qdrant(
+            request.message, current_user.id, request.retrieval
+        )
 
         # 构建包含上下文的消息
         messages = [{"role": "system", "content": "You are a helpful assistant."}]
@@ -76,11 +84,14 @@ async def chat_completion(
 
         messages.append({"role": "user", "content": request.message})
 
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            max_tokens=500,
-            temperature=0.7,
+        response = await llm_scheduler.run(
+            lambda: client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=messages,
+                max_tokens=500,
+                temperature=0.7,
+            ),
+            tokens=sum(estimate_tokens(m["content"]) for m in messages) + 500,
         )
 
         answer = response.choices[0].message.content
@@ -96,31 +107,54 @@ async def chat_completion(
 
         return ChatResponse(answer=answer, session_id=session_id)
 
+    except QdrantUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error calling OpenAI API: {str(e)}"
         )
 
 
+@router.get("/cache/stats")
+@require_permission("retrieval:manage")
+async def get_cache_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    查看查询向量缓存和持久化向量缓存的命中率
+    统计覆盖所有用户的请求，需要retrieval:manage权限
+    """
+    embedding_cache = get_embedding_cache()
+    return {
+        "query_cache": query_embedding_cache.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache else None,
+        "embedding_scheduler": embedding_scheduler.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+    }
+
+
 async def _retrieve_context_from_qdrant(
-    query: str, user_id: int, limit: int = 5
+    query: str, user_id: int, options: Optional[RetrievalOptions] = None
 ) -> str:
     """
     从Qdrant向量数据库中检索与查询相关的上下文
+    options中未设置的检索参数使用服务端默认配置
     """
     # 生成查询向量
     embedding_model = EmbeddingModel()
-    query_vector = embedding_model.embed_sigle(query)
-
-    # 在Qdrant中搜索相似内容（仅搜索当前用户的内容）
-    search_result = qdrant_client.query_points(
-        collection_name=QDRANT_COLLECTION_NAME,
-        query=query_vector,
-        limit=limit,
-        query_filter={"must": [{"key": "user_id", "match": {"value": user_id}}]},
+    query_vector = await embedding_model.embed_query(query)
+
+    # 在向量库中搜索相似内容（仅搜索当前用户的内容）
+    vector_store = get_vector_store()
+    hits = await vector_store.search(
+        query_vector, user_id, query_text=query, options=options
     )
+    # 检索只比较小的叶子块，交给模型的上下文扩展为完整的小节
+    if resolve_option(options, "expand_sections"):
+        hits = await vector_store.expand_sections(hits)
 
     # 提取相关内容
-    contexts = [point.payload.get("content", "") for point in search_result.points]
+    contexts = [hit.payload.get("content", "") for hit in hits]
 
     return "\n\n".join(contexts)
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, UploadFile, File, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from loguru import logger
 import os
 import uuid
+from typing import AsyncIterator
 
 from ..dependencies.depends import get_db
 from ..dependencies.security import get_current_active_user
@@ -14,9 +14,8 @@ from ..services.crud.file import create_file, get_file
 from ..models.knowledge_item import KnowledgeItem
 from ..schemas.knowledge_item import ItemCreate
 from ..services.crud.knowledge_item import create_knowledge_item
-from ..core.rag.qdrant_db import qdrant_client, QDRANT_COLLECTION_NAME
-from ..core.rag.embedding import EmbeddingModel
-from ..core.rag.chunking import DocumentChunker
+from ..core.rag.chunking import get_document_chunker, word_chunker
+from ..core.rag.ingest import ingest_document
 
 router = APIRouter(prefix="/files", tags=["files"])
 
@@ -59,112 +58,86 @@ async def upload_file_to_minio(
 
     # 简化文档处理逻辑
     file_content = await _process_document_if_supported(
-        file, file_url, current_user, db
+        file, file_url, file_record.id, current_user, db
     )
 
     return file_content
 
 
 async def _process_document_if_supported(
-    file: UploadFile, file_url: str, current_user: User, db: AsyncSession
+    file: UploadFile,
+    file_url: str,
+    file_id: int,
+    current_user: User,
+    db: AsyncSession,
 ):
-    """内部函数：处理支持的文档格式"""
+    """
+    内部函数：处理支持的文档格式
+    文档在转换进程中整篇转换后按片段暂存，API进程逐段分块、编码并写入向量库，
+    同一时刻只持有少量片段的文本
+    返回文件ID、写入的块数和近似重复块的比例，不支持的格式返回None
+    """
     file_ext = os.path.splitext(file.filename)[1].lower() if file.filename else ""
 
     if file_ext == ".docx":
         from ..core.processor import WordProcessor
 
-        word_processor = WordProcessor()
-
-        file.file.seek(0)
-        processed_text = await word_processor.process_document(
-            file_data=file.file, filename=file.filename
-        )
+        processor, file_type = WordProcessor(), "docx"
+    elif file_ext in [".xlsx", ".xls"]:
+        from ..core.processor import ExcelProcessor
 
-        # 将处理后的内容存储到知识库
-        knowledge_item = ItemCreate(
-            user_id=current_user.id,
-            content_type="file",
-            source=file_url,
-            cleaned_text=processed_text[:500],  # 限制长度以适应数据库字段
-        )
-        await create_knowledge_item(db, knowledge_item)
+        processor, file_type = ExcelProcessor(), "excel"
+    else:
+        return None
 
-        # 将内容分块并存储到Qdrant向量数据库
-        await _store_chunks_to_qdrant(processed_text, file_url, current_user.id, "docx")
+    file.file.seek(0)
+    preview = []
 
-        logger.debug(f"Word content: {processed_text}")
-        return processed_text
-    elif file_ext in [".xlsx", ".xls"]:
-        from ..core.processor import ExcelProcessor
+    async def segments():
+        async for segment in processor.iter_segments(file.file, file.filename):
+            if not preview:
+                preview.append(segment[:500])  # 限制长度以适应数据库字段
+            yield segment
 
-        excel_processor = ExcelProcessor()
+    # 将内容分块并存储到向量数据库
+    stats = await _store_chunks_to_qdrant(
+        segments(), file_url, current_user.id, file_id, file_type
+    )
 
-        file.file.seek(0)
-        processed_text = await excel_processor.process_document(
-            file_data=file.file, filename=file.filename
-        )
+    # 将处理后的内容存储到知识库
+    knowledge_item = ItemCreate(
+        user_id=current_user.id,
+        content_type="file",
+        source=file_url,
+        cleaned_text=preview[0] if preview else "",
+    )
+    await create_knowledge_item(db, knowledge_item)
 
-        # 将处理后的内容存储到知识库
-        knowledge_item = ItemCreate(
-            user_id=current_user.id,
-            content_type="file",
-            source=file_url,
-            cleaned_text=processed_text[:500],  # 限制长度以适应数据库字段
-        )
-        await create_knowledge_item(db, knowledge_item)
-
-        # 将内容存储到Qdrant向量数据库
-        await _store_chunks_to_qdrant(
-            processed_text, file_url, current_user.id, "excel"
-        )
-
-        logger.debug(f"Excel content: {processed_text}")
-        return processed_text
-    else:
-        return None
+    return {
+        "file_id": file_id,
+        "chunks": stats["points"],
+        "duplicates": stats["duplicates"],
+        "dedup_ratio": stats["dedup_ratio"],
+    }
 
 
 async def _store_chunks_to_qdrant(
-    content: str, source: str, user_id: int, file_type: str
-):
+    segments: AsyncIterator[str],
+    source: str,
+    user_id: int,
+    file_id: int,
+    file_type: str,
+) -> dict:
     """
-    将内容分块并存储到Qdrant向量数据库
+    将文档片段分块并存储到向量数据库
+    同一文件重新上传时覆盖未变化的块，并删除不再存在的旧块
     """
-    # 创建文档分块器
-    chunker = DocumentChunker()
-
-    # 根据文件类型进行不同的分块处理
+    # Word文档按标题分层分块，分块函数按文档获取；表格分块器在请求间共享
     if file_type == "docx":
-        chunks = chunker.chunk_word(content)
-    else:  # excel
-        chunks = chunker.chunk_excel(content)
-
-    # 为每个块生成向量并存储到Qdrant
-    for i, chunk in enumerate(chunks):
-        # 生成向量
-        embedding_model = EmbeddingModel()
-        vector = embedding_model.embed(chunk)
-
-        # 准备payload数据
-        payload = {
-            "content": chunk,
-            "source": source,
-            "user_id": user_id,
-            "file_type": file_type,
-            "chunk_index": i,
-        }
-
-        # 存储到Qdrant，使用UUID格式的point ID
-        import uuid
-
-        point_id = str(uuid.uuid4())
-        qdrant_client.upsert(
-            collection_name=QDRANT_COLLECTION_NAME,
-            points=[{"id": point_id, "vector": vector, "payload": payload}],
-        )
-
-    logger.info(f"Stored {len(chunks)} chunks to Qdrant for user {user_id}")
+        chunk = word_chunker()
+    else:
+        chunk = get_document_chunker().chunk_excel
+    return await ingest_document(segments, chunk, source, user_id, file_id, file_type)
 
 
 @router.get("/{file_id}", response_model=FileInfo)
@@ -0,0 +1,25 @@
+from typing import List
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.rag.tuning import benchmark_retrieval
+from ..dependencies.depends import get_db
+from ..dependencies.security import get_current_active_user, require_permission
+from ..schemas.retrieval import RetrievalBenchmarkRequest, RetrievalBenchmarkResult
+from ..schemas.user import User
+
+router = APIRouter(prefix="/retrieval", tags=["retrieval"])
+
+
+@router.post("/benchmark", response_model=List[RetrievalBenchmarkResult])
+@require_permission("retrieval:manage")
+async def run_retrieval_benchmark(
+    request: RetrievalBenchmarkRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    用样例查询比较不同检索参数的延迟和召回率，召回率以精确检索结果为基准
+    """
+    return await benchmark_retrieval(request.queries, request.user_id, request.options)
@@ -39,6 +39,7 @@ async def init_data():
             {"name": "permission:manage", "description": "Manage permissions"},
             {"name": "role:view", "description": "View roles"},
             {"name": "user:view", "description": "View users"},
+            {"name": "retrieval:manage", "description": "Tune retrieval parameters"},
         ]
 
         for perm_data in permissions:
@@ -58,7 +59,7 @@ async def init_data():
             logger.info(f"Role 'user' created: {user_role}")
 
         # Assign permissions to user role
-        user_permission = permissions[3:]  # role:view and user:view
+        user_permission = permissions[3:5]  # role:view and user:view
         for perm in user_permission:
             perm = await get_permission_by_name(async_session, perm["name"])
             if perm:
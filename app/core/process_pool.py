@@ -0,0 +1,145 @@
+import asyncio
+import os
+import resource
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# 文档转换进程池配置，工作进程数为0时按CPU核数
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", "0")) or os.cpu_count() or 1
+# 单个转换任务的超时时间（秒）
+CONVERSION_TIMEOUT = float(os.getenv("CONVERSION_TIMEOUT", "120"))
+# 工作进程执行该数量的任务后退出并由新进程替换，回收解析库泄漏或碎片化的内存
+CONVERSION_MAX_TASKS_PER_CHILD = int(os.getenv("CONVERSION_MAX_TASKS_PER_CHILD", "50"))
+# 工作进程的地址空间上限（MB），超出时任务抛出MemoryError，0表示不限制
+CONVERSION_MEMORY_LIMIT_MB = int(os.getenv("CONVERSION_MEMORY_LIMIT_MB", "4096"))
+# 因其他任务超时重启进程池而中断的任务，重新提交的最大次数
+CONVERSION_MAX_RESUBMITS = int(os.getenv("CONVERSION_MAX_RESUBMITS", "2"))
+
+T = TypeVar("T")
+
+
+class ConversionTimeout(TimeoutError):
+    """转换任务超时，执行该任务的工作进程已被终止"""
+
+
+def _init_worker(memory_limit_mb: int):
+    """
+    工作进程初始化：限制地址空间
+    RLIMIT_AS限制的是虚拟内存而不是RSS，但能在超出时让分配失败，而不是拖垮整台机器
+    """
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class ConversionPool:
+    """
+    文档转换使用的进程池
+    mammoth、markdownify和pandas的解析是同步的CPU密集操作，放到独立进程中执行，
+    API进程的事件循环不被阻塞，多个文档的转换可以利用多个CPU核
+    """
+
+    def __init__(
+        self,
+        workers: int = CONVERSION_WORKERS,
+        timeout: float = CONVERSION_TIMEOUT,
+        max_tasks_per_child: int = CONVERSION_MAX_TASKS_PER_CHILD,
+        memory_limit_mb: int = CONVERSION_MEMORY_LIMIT_MB,
+        max_resubmits: int = CONVERSION_MAX_RESUBMITS,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self.memory_limit_mb = memory_limit_mb
+        self.max_resubmits = max_resubmits
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # 因任务超时被终止的进程池，其中其他任务的失败不是任务自身导致的
+        self._killed: weakref.WeakSet[ProcessPoolExecutor] = weakref.WeakSet()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # 首次使用时创建，不转换文档的进程不会启动工作进程
+        if self._executor is None:
+            logger.info(f"Starting conversion pool with {self.workers} workers")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                max_tasks_per_child=self.max_tasks_per_child,
+                initializer=_init_worker,
+                initargs=(self.memory_limit_mb,),
+            )
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor, kill: bool = True):
+        """丢弃进程池，下一个任务会创建新的进程池"""
+        if self._executor is executor:
+            self._executor = None
+        if kill:
+            self._killed.add(executor)
+            executor.kill_workers()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _interrupted(
+        self, executor: ProcessPoolExecutor, attempt: int, func: Callable
+    ) -> bool:
+        """任务是否因其他任务超时终止进程池而中断，且还可以重新提交"""
+        if executor not in self._killed or attempt >= self.max_resubmits:
+            return False
+        logger.warning(
+            f"Conversion {func.__name__} was interrupted by a pool restart, "
+            f"resubmitting ({attempt + 1}/{self.max_resubmits})"
+        )
+        return True
+
+    async def run(
+        self, func: Callable[..., T], *args, timeout: Optional[float] = None
+    ) -> T:
+        """
+        在工作进程中执行func，func及其参数和返回值需要可以pickle
+        超时的任务无法单独取消，会终止整个进程池后重建，
+        同时在执行或排队的其他任务会重新提交到新的进程池，最多max_resubmits次
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            executor = self._get_executor()
+            future = executor.submit(func, *args)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except TimeoutError:
+                logger.error(
+                    f"Conversion {func.__name__} timed out after {timeout}s, "
+                    "restarting the pool"
+                )
+                self._discard(executor)
+                raise ConversionTimeout(
+                    f"Conversion {func.__name__} exceeded {timeout}s"
+                )
+            except BrokenProcessPool:
+                if not self._interrupted(executor, attempt, func):
+                    # 工作进程异常退出（如被系统OOM终止），进程池不可再用
+                    logger.error(f"Conversion pool broke while running {func.__name__}")
+                    self._discard(executor, kill=False)
+                    raise
+            except asyncio.CancelledError:
+                # 终止进程池时排队中的任务被取消，调用方自身被取消时照常抛出
+                if (
+                    not future.cancelled()
+                    or asyncio.current_task().cancelling()
+                    or not self._interrupted(executor, attempt, func)
+                ):
+                    raise
+            attempt += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+conversion_pool = ConversionPool()
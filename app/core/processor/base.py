@@ -1,7 +1,42 @@
+import asyncio
+import os
+import tempfile
 from abc import ABC, abstractmethod
-from typing import BinaryIO
+from typing import AsyncIterator, BinaryIO, Callable, Iterable, List
 
 from ..database import MINIO_BUCKET_NAME, minio_client
+from ..process_pool import conversion_pool
+
+
+def write_segments(segments: Iterable[str], directory: str) -> List[str]:
+    """在转换进程中将片段逐个写入directory下的文件，返回文件路径"""
+    paths = []
+    for number, segment in enumerate(segments):
+        path = os.path.join(directory, f"segment-{number:06d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(segment)
+        paths.append(path)
+    return paths
+
+
+def _read_segment(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        segment = f.read()
+    os.remove(path)
+    return segment
+
+
+async def iter_spooled_segments(
+    convert: Callable[..., List[str]], *args
+) -> AsyncIterator[str]:
+    """
+    在转换进程中执行convert(*args, directory)，由其把各片段写入临时目录，再逐个读取产出
+    转换结果不经进程间传递，API进程同一时刻只持有一个片段的文本
+    """
+    with tempfile.TemporaryDirectory(prefix="segments-") as directory:
+        paths = await conversion_pool.run(convert, *args, directory)
+        for path in paths:
+            yield await asyncio.to_thread(_read_segment, path)
 
 
 class BaseProcessor(ABC):
@@ -11,3 +46,12 @@ class BaseProcessor(ABC):
     @abstractmethod
     async def process_document(self, file_data: BinaryIO, filename: str) -> str:
         pass
+
+    async def iter_segments(
+        self, file_data: BinaryIO, filename: str
+    ) -> AsyncIterator[str]:
+        """
+        按片段产出转换后的Markdown，供流式导入使用
+        每个片段可以独立分块，默认整个文档作为一个片段
+        """
+        yield await self.process_document(file_data, filename)
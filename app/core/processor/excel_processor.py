@@ -1,21 +1,67 @@
 import os
-from typing import BinaryIO
+from io import BytesIO
+from typing import AsyncIterator, BinaryIO, List
 
 import pandas as pd
+from dotenv import load_dotenv
 
-from .base import BaseProcessor
+from ..process_pool import conversion_pool
+from .base import BaseProcessor, iter_spooled_segments, write_segments
+
+load_dotenv()
+
+# 流式导入时每个片段包含的数据行数，每个片段都是带表头的完整表格
+EXCEL_SEGMENT_ROWS = int(os.getenv("EXCEL_SEGMENT_ROWS", "1000"))
+
+
+def excel_to_markdown(content: bytes) -> str:
+    """在转换进程中解析工作簿并转换为Markdown表格"""
+    return pd.read_excel(BytesIO(content)).to_markdown(index=False)
+
+
+def write_excel_segments(
+    content: bytes, segment_rows: int, directory: str
+) -> List[str]:
+    """
+    在转换进程中解析工作簿，每segment_rows行转换为一段Markdown表格写入directory，
+    返回各片段的文件路径，DataFrame和表格文本都不经进程间传递
+    """
+    data = pd.read_excel(BytesIO(content))
+    return write_segments(
+        (
+            data.iloc[start : start + segment_rows].to_markdown(index=False)
+            for start in range(0, len(data), segment_rows)
+        ),
+        directory,
+    )
 
 
 class ExcelProcessor(BaseProcessor):
-    async def process_document(self, file_data: BinaryIO, filename: str):
+    def _check_extension(self, filename: str):
         file_extension = os.path.splitext(filename)[1].lower()
         if file_extension not in [".xls", ".xlsx"]:
             raise ValueError(
                 f"ExcelProcessor can not handle the file with extension like {file_extension}"
             )
+
+    async def process_document(self, file_data: BinaryIO, filename: str):
+        self._check_extension(filename)
         md_text = await self.parse_excel(file_data)
         return md_text
 
     async def parse_excel(self, file_data: BinaryIO):
-        data = pd.read_excel(file_data)
-        return data.to_markdown(index=False)
+        return await conversion_pool.run(excel_to_markdown, file_data.read())
+
+    async def iter_segments(
+        self, file_data: BinaryIO, filename: str
+    ) -> AsyncIterator[str]:
+        """
+        按EXCEL_SEGMENT_ROWS行一段产出Markdown表格
+        解析和转换在转换进程中完成，片段暂存在临时文件中，逐段读取产出，
+        API进程同一时刻只持有一个片段的文本
+        """
+        self._check_extension(filename)
+        async for segment in iter_spooled_segments(
+            write_excel_segments, file_data.read(), EXCEL_SEGMENT_ROWS
+        ):
+            yield segment
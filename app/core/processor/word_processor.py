@@ -1,12 +1,22 @@
 import os
+import re
 from io import BytesIO
-from typing import BinaryIO
+from typing import AsyncIterator, BinaryIO, List
 
 import mammoth
+from dotenv import load_dotenv
 from markdownify import markdownify as md
 
 from ...utils.save2minio import upload_file
-from .base import BaseProcessor
+from ..process_pool import conversion_pool
+from .base import BaseProcessor, iter_spooled_segments, write_segments
+
+load_dotenv()
+
+# 流式导入时每个片段的目标字符数，片段在标题处切分
+WORD_SEGMENT_CHARS = int(os.getenv("WORD_SEGMENT_CHARS", "20000"))
+
+_HEADING_PATTERN = re.compile(r"^(?=#{1,6} )", re.MULTILINE)
 
 
 @mammoth.images.img_element
@@ -24,17 +34,58 @@ def convert_image(image):
     return {"src": image_url}
 
 
+def convert_docx(content: bytes) -> str:
+    """在转换进程中将docx转换为Markdown，图片上传到MinIO"""
+    result = mammoth.convert_to_html(
+        fileobj=BytesIO(content), convert_image=convert_image
+    )
+    return md(result.value, heading_style="ATX")
+
+
+def split_sections(md_text: str, max_chars: int) -> List[str]:
+    """在标题处切分Markdown，相邻的小节合并到不超过max_chars，单个超长小节保持完整"""
+    segments, current = [], ""
+    for section in _HEADING_PATTERN.split(md_text):
+        if current and len(current) + len(section) > max_chars:
+            segments.append(current)
+            current = ""
+        current += section
+    if current:
+        segments.append(current)
+    return segments
+
+
+def write_docx_sections(content: bytes, max_chars: int, directory: str) -> List[str]:
+    """在转换进程中转换docx，按标题切分后写入directory，返回各片段的文件路径"""
+    return write_segments(split_sections(convert_docx(content), max_chars), directory)
+
+
 class WordProcessor(BaseProcessor):
-    async def process_document(self, file_data: BinaryIO, filename: str):
+    def _check_extension(self, filename: str):
         file_extension = os.path.splitext(filename)[1].lower()
         if file_extension not in [".docx"]:
             raise ValueError(
                 f"WordProcessor can not handle the file with extension like {file_extension}"
             )
+
+    async def process_document(self, file_data: BinaryIO, filename: str):
+        self._check_extension(filename)
         md_text = await self.parse_docx(file_data)
         return md_text
 
+    async def iter_segments(
+        self, file_data: BinaryIO, filename: str
+    ) -> AsyncIterator[str]:
+        """
+        按标题切分后逐段产出Markdown
+        mammoth只能整篇转换，转换和切分在转换进程中完成，片段暂存在临时文件中，
+        逐段读取产出，API进程不持有整篇文本
+        """
+        self._check_extension(filename)
+        async for segment in iter_spooled_segments(
+            write_docx_sections, file_data.read(), WORD_SEGMENT_CHARS
+        ):
+            yield segment
+
     async def parse_docx(self, file_data: BinaryIO):
-        result = mammoth.convert_to_html(fileobj=file_data, convert_image=convert_image)
-        md_text = md(result.value, heading_style="ATX")
-        return md_text
+        return await conversion_pool.run(convert_docx, file_data.read())
@@ -1,32 +1,277 @@
-from typing import List
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
 
-from chonkie import RecursiveChunker, RecursiveRules, TableChunker
+from chonkie import RecursiveChunker, RecursiveLevel, RecursiveRules
+from dotenv import load_dotenv
+
+from .tokenizer import get_token_counter
+
+load_dotenv()
+
+# 各格式的默认块大小与重叠，单位为嵌入模型的token
+WORD_CHUNK_SIZE = int(os.getenv("WORD_CHUNK_SIZE", "512"))
+WORD_CHUNK_OVERLAP = int(os.getenv("WORD_CHUNK_OVERLAP", "64"))
+EXCEL_CHUNK_SIZE = int(os.getenv("EXCEL_CHUNK_SIZE", "512"))
+EXCEL_CHUNK_OVERLAP = int(os.getenv("EXCEL_CHUNK_OVERLAP", "0"))
+# 分块使用的分词器，为空时与嵌入模型一致，设为character时按字符计数
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")
+# Word文档按标题分层：只对小的叶子块编码，检索命中后扩展为所在小节
+HIERARCHICAL_CHUNKS = os.getenv("HIERARCHICAL_CHUNKS", "True").lower() == "true"
+LEAF_CHUNK_SIZE = int(os.getenv("LEAF_CHUNK_SIZE", "256"))
+LEAF_CHUNK_OVERLAP = int(os.getenv("LEAF_CHUNK_OVERLAP", "32"))
+# 超过该token数的小节不作为上下文扩展的父块，命中时只返回叶子块
+SECTION_MAX_TOKENS = int(os.getenv("SECTION_MAX_TOKENS", "1024"))
+
+# 按段落、句子、分句、空白逐级切分，中英文标点都作为边界
+# 不使用按token切分的最后一级，超长的片段由split_by_tokens处理
+CHUNK_RULES = RecursiveRules(
+    levels=[
+        RecursiveLevel(delimiters=["\n\n", "\r\n", "\n", "\r"]),
+        RecursiveLevel(delimiters=["。", "！", "？", "；", ". ", "! ", "? ", "; "]),
+        RecursiveLevel(delimiters=["，", "、", "：", ", ", ": "]),
+        RecursiveLevel(whitespace=True),
+    ]
+)
+# 重叠部分尽量从这些字符之后开始，避免从词中间截断
+_OVERLAP_BOUNDARIES = set("\n。！？；，、：.!?;,: ")
+_HEADING_SPLIT = re.compile(r"^(?=#{1,6} )", re.MULTILINE)
+_HEADING = re.compile(r"(#{1,6}) +(.*)")
+# 表格的每一行从行首的竖线开始，单元格内的换行不会切开一行
+_TABLE_ROW = re.compile(r"(?<=\n)(?=\|)")
+
+
+@lru_cache(maxsize=None)
+def get_chunk_counter(tokenizer: str = "") -> Callable[[str], int]:
+    """分块时的token计数函数"""
+    if tokenizer == "character":
+        return len
+    return get_token_counter(tokenizer or CHUNK_TOKENIZER or None)
+
+
+def _chonkie_tokenizer(tokenizer: str):
+    return "character" if tokenizer == "character" else get_chunk_counter(tokenizer)
+
+
+@lru_cache(maxsize=None)
+def get_recursive_chunker(
+    chunk_size: int, tokenizer: str = "", min_characters_per_chunk: int = 24
+) -> RecursiveChunker:
+    """
+    按配置缓存的递归分块器
+    chunk()不在实例上保存单次调用的状态，同一实例可以在并发请求间共享
+    """
+    return RecursiveChunker(
+        tokenizer=_chonkie_tokenizer(tokenizer),
+        chunk_size=chunk_size,
+        rules=CHUNK_RULES,
+        min_characters_per_chunk=min_characters_per_chunk,
+    )
+
+
+def split_table(table: str) -> Tuple[str, List[str]]:
+    """将Markdown表格拆为表头（标题行和分隔行）与数据行，各行保留结尾的换行"""
+    lines = _TABLE_ROW.split(table)
+    return "".join(lines[:2]), lines[2:]
+
+
+def chunk_table(
+    table: str, max_tokens: int, count_tokens: Callable[[str], int]
+) -> List[str]:
+    """按行打包Markdown表格，每个块都以表头开头，单行超出预算时独占一块"""
+    if not table.strip():
+        return []
+    if count_tokens(table) <= max_tokens:
+        return [table]
+    header, rows = split_table(table)
+    header_tokens = count_tokens(header)
+    chunks, current, size = [], [], header_tokens
+    for row in rows:
+        row_tokens = count_tokens(row)
+        if current and size + row_tokens > max_tokens:
+            chunks.append(header + "".join(current))
+            current, size = [], header_tokens
+        current.append(row)
+        size += row_tokens
+    if current:
+        chunks.append(header + "".join(current))
+    return chunks
+
+
+def split_by_tokens(
+    text: str, max_tokens: int, count_tokens: Callable[[str], int]
+) -> List[str]:
+    """将没有可用边界的超长文本按token预算切开，每段用二分查找确定结束位置"""
+    pieces = []
+    start = 0
+    while start < len(text):
+        low, high = start + 1, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(text[start:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        pieces.append(text[start:low])
+        start = low
+    return pieces
+
+
+def overlap_tail(text: str, overlap: int, count_tokens: Callable[[str], int]) -> str:
+    """取text末尾不超过overlap个token的部分，并对齐到最近的边界字符之后"""
+    if overlap <= 0 or not text:
+        return ""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high) // 2
+        if count_tokens(text[middle:]) <= overlap:
+            high = middle
+        else:
+            low = middle + 1
+    for i in range(low, len(text) - 1):
+        if text[i] in _OVERLAP_BOUNDARIES:
+            return text[i + 1 :]
+    return text[low:]
 
 
 class DocumentChunker:
-    """文档分块处理器"""
+    """
+    文档分块处理器
+    块大小按嵌入模型的token计数，每个块以前一块末尾的chunk_overlap个token开头，
+    未指定的参数使用对应格式的默认配置
+    """
 
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50):
+    def __init__(
+        self,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
+        tokenizer: str = "",
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.tokenizer = tokenizer
+
+    def _config(self, default_size: int, default_overlap: int):
+        chunk_size = self.chunk_size or default_size
+        overlap = default_overlap if self.chunk_overlap is None else self.chunk_overlap
+        if not 0 <= overlap < chunk_size:
+            raise ValueError(
+                f"chunk_overlap {overlap} must be smaller than chunk_size {chunk_size}"
+            )
+        # 重叠部分计入块大小，正文只使用剩余的预算
+        return chunk_size - overlap, overlap
 
     def chunk_excel(self, text: str) -> List[str]:
-        chunker = TableChunker(
-            tokenizer="character",
-            chunk_size=self.chunk_size,
-        )
-        chunks = chunker.chunk(text)
-        return [chunk.text for chunk in chunks]
+        body_size, overlap = self._config(EXCEL_CHUNK_SIZE, EXCEL_CHUNK_OVERLAP)
+        count_tokens = get_chunk_counter(self.tokenizer)
+        chunks = chunk_table(text, body_size, count_tokens)
+        if overlap == 0 or len(chunks) < 2:
+            return chunks
+
+        # 表格的重叠以整行为单位，插在表头之后
+        header, _ = split_table(chunks[0])
+        result = [chunks[0]]
+        for previous, chunk in zip(chunks, chunks[1:]):
+            previous_rows = split_table(previous)[1]
+            repeated = []
+            budget = overlap
+            for row in reversed(previous_rows):
+                budget -= count_tokens(row)
+                if budget < 0:
+                    break
+                repeated.insert(0, row)
+            result.append(header + "".join(repeated) + chunk[len(header) :])
+        return result
 
     def chunk_word(self, markdown_text: str) -> List[str]:
         """
         针对Markdown文本的分块处理
         """
-        chunker = RecursiveChunker(
-            tokenizer_or_token_counter="character",
-            chunk_size=self.chunk_size,
-            rules=RecursiveRules(),
-            min_characters_per_chunk=24,
-        )
-        chunks = chunker.chunk(markdown_text)
-        return [chunk.text for chunk in chunks]
+        body_size, overlap = self._config(WORD_CHUNK_SIZE, WORD_CHUNK_OVERLAP)
+        chunker = get_recursive_chunker(body_size, self.tokenizer)
+        count_tokens = get_chunk_counter(self.tokenizer)
+        pieces = []
+        for chunk in chunker.chunk(markdown_text):
+            if chunk.token_count > body_size:
+                pieces.extend(split_by_tokens(chunk.text, body_size, count_tokens))
+            else:
+                pieces.append(chunk.text)
+
+        chunks = pieces[:1]
+        for previous, piece in zip(pieces, pieces[1:]):
+            chunks.append(overlap_tail(previous, overlap, count_tokens) + piece)
+        return chunks
+
+
+@dataclass
+class Section:
+    """文档中一个标题下的内容（不含下级小节），作为叶子块的父块"""
+
+    index: int
+    path: Tuple[str, ...]
+    text: str
+
+
+@dataclass
+class LeafChunk:
+    text: str
+    # 从一级标题到所在小节的标题
+    section_path: Tuple[str, ...] = ()
+    # 小节过大或只有一个叶子块时为None
+    section: Optional[Section] = field(default=None, repr=False)
+
+
+class SectionChunker:
+    """
+    按标题分层的分块器，每个文档使用一个实例
+    片段须在标题处切分，标题层级在同一文档的片段之间延续
+    """
+
+    def __init__(self, chunker: "DocumentChunker", max_section_tokens: int):
+        self.chunker = chunker
+        self.max_section_tokens = max_section_tokens
+        self._headings: List[Tuple[int, str]] = []
+        self._sections = 0
+
+    def __call__(self, segment: str) -> List[LeafChunk]:
+        count_tokens = get_chunk_counter(self.chunker.tokenizer)
+        leaves = []
+        for text in _HEADING_SPLIT.split(segment):
+            if not text.strip():
+                continue
+            heading = _HEADING.match(text)
+            if heading:
+                level = len(heading.group(1))
+                while self._headings and self._headings[-1][0] >= level:
+                    self._headings.pop()
+                self._headings.append((level, heading.group(2).strip()))
+            path = tuple(title for _, title in self._headings)
+            chunks = self.chunker.chunk_word(text)
+            section = None
+            if len(chunks) > 1 and count_tokens(text) <= self.max_section_tokens:
+                section = Section(self._sections, path, text)
+                self._sections += 1
+            leaves.extend(LeafChunk(chunk, path, section) for chunk in chunks)
+        return leaves
+
+
+@lru_cache(maxsize=None)
+def get_document_chunker(
+    chunk_size: Optional[int] = None,
+    chunk_overlap: Optional[int] = None,
+    tokenizer: str = "",
+) -> DocumentChunker:
+    """获取共享的文档分块处理器"""
+    return DocumentChunker(chunk_size, chunk_overlap, tokenizer)
+
+
+def word_chunker(
+    hierarchical: bool = HIERARCHICAL_CHUNKS,
+) -> Callable[[str], List[LeafChunk] | List[str]]:
+    """获取一个Word文档的分块函数，分层分块时每个文档需要单独获取"""
+    if not hierarchical:
+        return get_document_chunker().chunk_word
+    leaf_chunker = get_document_chunker(LEAF_CHUNK_SIZE, LEAF_CHUNK_OVERLAP)
+    return SectionChunker(leaf_chunker, SECTION_MAX_TOKENS)
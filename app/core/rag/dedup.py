@@ -0,0 +1,216 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from loguru import logger
+
+from .sparse import tokenize
+
+load_dotenv()
+
+# 导入时跳过与同一用户已有块近似重复的块
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "True").lower() == "true"
+DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH", ".cache/dedup.sqlite3")
+# SimHash的汉明距离不超过该值时视为重复，最大为SIMHASH_BANDS - 1
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+
+SIMHASH_BITS = 64
+# 64位签名分成4段，距离不超过3的两个签名至少有一段完全相同，按段查询候选
+SIMHASH_BANDS = 4
+_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_SIGN_BIT = 1 << (SIMHASH_BITS - 1)
+# Markdown表格的分隔行，如|---|:---:|
+_TABLE_SEPARATOR = re.compile(r"[\s|:]*-[\s|:-]*")
+
+
+def _tokens(text: str) -> List[str]:
+    # 中文单字过于常见，只用二字组合和编号作为特征，避免无关文本的签名相互接近
+    return [token for token in tokenize(text) if len(token) > 1 or token.isascii()]
+
+
+def _features(text: str) -> Counter:
+    lines = text.strip().split("\n")
+    if (
+        len(lines) > 1
+        and lines[0].lstrip().startswith("|")
+        and _TABLE_SEPARATOR.fullmatch(lines[1])
+    ):
+        # 表格块都以同一表头开头，同一列的取值也大量重复，按次数加权时
+        # 不同行的块签名会很接近，因此只用数据行的特征，且每个特征只计一次
+        return Counter(set(_tokens("\n".join(lines[2:]))))
+    return Counter(_tokens(text))
+
+
+def simhash(text: str) -> int:
+    """计算文本的64位SimHash，各特征按出现次数加权"""
+    return _simhash(_features(text))
+
+
+def _simhash(features: Counter) -> int:
+    if not features:
+        return 0
+    hashes = np.array(
+        [
+            hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            for token in features
+        ]
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(len(features), 8), axis=1)
+    weights = np.fromiter(features.values(), dtype=np.int64, count=len(features))
+    votes = weights @ (bits.astype(np.int64) * 2 - 1)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _bands(signature: int) -> List[int]:
+    return [(signature >> (i * _BAND_BITS)) & _BAND_MASK for i in range(SIMHASH_BANDS)]
+
+
+def _to_signed(signature: int) -> int:
+    # SQLite的INTEGER是有符号64位整数
+    return signature - (1 << SIMHASH_BITS) if signature & _SIGN_BIT else signature
+
+
+class PendingSignatures:
+    """
+    导入中的文件已保留的块的签名，按段索引在内存中
+    文件写入成功后再登记到SignatureIndex，导入失败时直接丢弃
+    """
+
+    def __init__(self):
+        self.signatures: List[int] = []
+        self._bands: List[Dict[int, List[int]]] = [
+            defaultdict(list) for _ in range(SIMHASH_BANDS)
+        ]
+
+    def is_duplicate(self, signature: int, max_distance: int) -> bool:
+        return any(
+            hamming_distance(signature, candidate) <= max_distance
+            for i, band in enumerate(_bands(signature))
+            for candidate in self._bands[i].get(band, ())
+        )
+
+    def add(self, signature: int):
+        self.signatures.append(signature)
+        for i, band in enumerate(_bands(signature)):
+            self._bands[i][band].append(signature)
+
+
+class SignatureIndex:
+    """
+    按用户划分的SimHash签名索引，存放在SQLite中
+    每个签名按段建立索引，查询时只比较至少有一段相同的候选签名
+    """
+
+    def __init__(self, path: str, max_distance: int = DEDUP_MAX_DISTANCE):
+        if not 0 <= max_distance < SIMHASH_BANDS:
+            raise ValueError(
+                f"DEDUP_MAX_DISTANCE must be between 0 and {SIMHASH_BANDS - 1}"
+            )
+        self.path = path
+        self.max_distance = max_distance
+        self._placeholders = ", ".join("?" * (3 + SIMHASH_BANDS))
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        band_columns = ", ".join(
+            f"band{i} INTEGER NOT NULL" for i in range(SIMHASH_BANDS)
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures ("
+            "user_id INTEGER NOT NULL, file_id INTEGER NOT NULL, "
+            f"signature INTEGER NOT NULL, {band_columns})"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_signatures_file "
+            "ON signatures (user_id, file_id)"
+        )
+        for i in range(SIMHASH_BANDS):
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_signatures_band{i} "
+                f"ON signatures (user_id, band{i})"
+            )
+        self._conn.commit()
+
+    def _is_duplicate(self, user_id: int, file_id: int, signature: int) -> bool:
+        # 不与该文件旧版本的签名比较，否则重新导入时未变化的块会被判为重复
+        condition = " OR ".join(f"band{i} = ?" for i in range(SIMHASH_BANDS))
+        rows = self._conn.execute(
+            "SELECT signature FROM signatures "
+            f"WHERE user_id = ? AND file_id != ? AND ({condition})",
+            (user_id, file_id, *_bands(signature)),
+        )
+        return any(
+            hamming_distance(signature, candidate % (1 << SIMHASH_BITS))
+            <= self.max_distance
+            for (candidate,) in rows
+        )
+
+    def mark_duplicates(
+        self, user_id: int, file_id: int, texts: List[str], pending: PendingSignatures
+    ) -> List[bool]:
+        """
+        逐个判断文本是否与该用户其他文件已导入的块或pending中的块重复
+        不重复的签名加入pending，同一文件内后出现的重复块也会被标记
+        没有特征的文本（如只有标点或单字）签名都相同，不参与去重
+        """
+        duplicates = []
+        with self._lock:
+            for text in texts:
+                features = _features(text)
+                if not features:
+                    duplicates.append(False)
+                    continue
+                signature = _simhash(features)
+                duplicate = pending.is_duplicate(
+                    signature, self.max_distance
+                ) or self._is_duplicate(user_id, file_id, signature)
+                if not duplicate:
+                    pending.add(signature)
+                duplicates.append(duplicate)
+        return duplicates
+
+    def replace_file(self, user_id: int, file_id: int, signatures: List[int]):
+        """用文件本次导入的签名替换其旧版本的签名，在文件全部写入成功后调用"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM signatures WHERE user_id = ? AND file_id = ?",
+                (user_id, file_id),
+            )
+            self._conn.executemany(
+                f"INSERT INTO signatures VALUES ({self._placeholders})",
+                [
+                    (user_id, file_id, _to_signed(signature), *_bands(signature))
+                    for signature in signatures
+                ],
+            )
+            self._conn.commit()
+
+
+_signature_index: Optional[SignatureIndex] = None
+
+
+def get_signature_index() -> Optional[SignatureIndex]:
+    """获取全局签名索引，未启用去重时返回None"""
+    global _signature_index
+    if not DEDUP_ENABLED:
+        return None
+    if _signature_index is None:
+        logger.info(f"Opening dedup signature index at {DEDUP_INDEX_PATH}")
+        _signature_index = SignatureIndex(DEDUP_INDEX_PATH)
+    return _signature_index
@@ -1,45 +1,297 @@
+import asyncio
 import os
-from typing import List
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from loguru import logger
-from openai import OpenAI
+
+from ..scheduler import embedding_scheduler
+from .embedding_backends import EmbeddingBackend, create_backend
+from .embedding_cache import (
+    get_embedding_cache,
+    make_cache_key,
+    normalize_query,
+    query_embedding_cache,
+)
+from .tokenizer import get_token_counter
 
 load_dotenv()
 
-# 嵌入模型配置
-EMBEDDING_BASE_URL = os.getenv("EMBEDDING_BASE_URL")
-EMBEDDING_API_KEY = os.getenv("EMBEDDING_API_KEY")
-EMBEDDING_DIM = os.getenv("EMBEDDING_DIM")
-EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME")
+# 批量编码配置：单次请求的最大条数与最大token数
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "8000"))
+# 查询编码的微批配置：最长等待时间（毫秒）与单批最大条数
+EMBEDDING_MICROBATCH_MAX_WAIT_MS = float(
+    os.getenv("EMBEDDING_MICROBATCH_MAX_WAIT_MS", "5")
+)
+EMBEDDING_MICROBATCH_MAX_SIZE = int(os.getenv("EMBEDDING_MICROBATCH_MAX_SIZE", "32"))
+
+
+@dataclass
+class EmbeddingBatch:
+    """一次嵌入请求包含的文本及其在原始输入中的位置"""
+
+    indices: List[int] = field(default_factory=list)
+    texts: List[str] = field(default_factory=list)
+    tokens: int = 0
+
+
+def pack_batches(
+    texts: List[str],
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+    max_items: int = EMBEDDING_BATCH_SIZE,
+    count_tokens: Optional[Callable[[str], int]] = None,
+) -> List[EmbeddingBatch]:
+    """
+    按token预算把文本装箱成尽量少的批次
+    使用first-fit decreasing：先放长文本，短文本填补剩余空间
+    超过预算的单条文本独占一个批次，结果通过indices还原顺序
+    """
+    count_tokens = count_tokens or get_token_counter()
+    sizes = [count_tokens(text) for text in texts]
+    batches: List[EmbeddingBatch] = []
+    for index in sorted(range(len(texts)), key=lambda i: sizes[i], reverse=True):
+        size = sizes[index]
+        for batch in batches:
+            if len(batch.texts) < max_items and batch.tokens + size <= max_tokens:
+                break
+        else:
+            batch = EmbeddingBatch()
+            batches.append(batch)
+        batch.indices.append(index)
+        batch.texts.append(texts[index])
+        batch.tokens += size
+    return batches
+
+
+def log_batch_utilization(batches: List[EmbeddingBatch], max_tokens: int):
+    """记录每个批次的token利用率"""
+    if not batches:
+        return
+    utilization = [batch.tokens / max_tokens for batch in batches]
+    logger.info(
+        f"Packed {sum(len(b.texts) for b in batches)} texts into {len(batches)} "
+        f"embedding requests, token utilization "
+        f"mean={sum(utilization) / len(utilization):.0%} "
+        f"min={min(utilization):.0%} max={max(utilization):.0%}"
+    )
+    for number, batch in enumerate(batches):
+        logger.debug(
+            f"Batch {number}: {len(batch.texts)} texts, {batch.tokens} tokens "
+            f"({batch.tokens / max_tokens:.0%})"
+        )
+
+
+class EmbeddingMicroBatcher:
+    """
+    微批调度器：把短时间内并发到达的单条编码请求合并为一次批量请求
+    第一条请求到达后最多等待max_wait_ms或凑满max_batch_size条即发出
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_wait_ms: float = EMBEDDING_MICROBATCH_MAX_WAIT_MS,
+        max_batch_size: int = EMBEDDING_MICROBATCH_MAX_SIZE,
+    ):
+        self._embed_batch = embed_batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._dispatches: set[asyncio.Task] = set()
+
+    async def submit(self, text: str) -> List[float]:
+        """提交一条文本，等待所在批次完成后返回其向量"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait((text, future))
+        return await future
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._collect())
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
+            # 批次在独立任务中发出，收集下一批不必等待上一批返回
+            task = self._loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        pending = [(text, future) for text, future in batch if not future.done()]
+        if not pending:
+            return
+        try:
+            vectors = await self._embed_batch([text for text, _ in pending])
+        except Exception as exc:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), vector in zip(pending, vectors):
+            if not future.done():
+                future.set_result(vector)
+        logger.debug(f"Dispatched micro-batch of {len(pending)} queries")
 
 
 class EmbeddingModel:
-    _client = None
+    _backend: EmbeddingBackend = None
+    _cache = None
+    _batcher = None
 
     def __init__(self):
-        if self._client is None:
-            logger.info("Loading embedding client")
-            self._client = OpenAI(
-                api_key=EMBEDDING_API_KEY,
-                base_url=EMBEDDING_BASE_URL,
-            )
+        if EmbeddingModel._backend is None:
+            EmbeddingModel._backend = create_backend()
+        if EmbeddingModel._cache is None:
+            EmbeddingModel._cache = get_embedding_cache()
+
+    def _get_batcher(self) -> EmbeddingMicroBatcher:
+        if EmbeddingModel._batcher is None:
+            EmbeddingModel._batcher = EmbeddingMicroBatcher(self.aembed_batch)
+        return EmbeddingModel._batcher
+
+    @property
+    def backend(self) -> EmbeddingBackend:
+        return self._backend
 
     def embed_sigle(self, text: str):
         try:
-            completion = self._client.embeddings.create(
-                model=EMBEDDING_MODEL_NAME,
-                input=text,
-                dimensions=EMBEDDING_DIM,
-                encoding_format="float",
-            )
-            embedding = completion.data[0].embedding
+            embedding = self._backend.embed_texts([text])[0]
             logger.info(f"Embedding text: {text}")
             return embedding
         except Exception as exc:
             logger.error(f"Error embedding text: {exc}")
             raise exc
 
+    def _lookup_cache(
+        self, texts: List[str]
+    ) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+        """
+        查询缓存，返回每条文本的缓存键、已命中的向量以及待编码的文本
+        待编码文本按缓存键去重，同一内容只请求一次
+        """
+        model_name, dim = self._backend.model_name, self._backend.dim
+        keys = [make_cache_key(model_name, dim, text) for text in texts]
+        cached = self._cache.get_many(keys) if self._cache is not None else {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        return keys, cached, missing
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        批量编码，命中缓存的文本不再请求接口
+        返回结果与输入顺序一致
+        """
+        keys, cached, missing = self._lookup_cache(texts)
+        fresh = dict(zip(missing, self._embed_uncached(list(missing.values()))))
+        if self._cache is not None:
+            self._cache.put_many(fresh)
+        return [cached[key] if key in cached else fresh[key] for key in keys]
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """按token预算装箱，每个批次只发起一次请求"""
+        batches = pack_batches(texts)
+        log_batch_utilization(batches, EMBEDDING_BATCH_MAX_TOKENS)
+        embeddings: List[List[float]] = [None] * len(texts)
+        for batch in batches:
+            try:
+                vectors = self._backend.embed_texts(batch.texts)
+            except Exception as exc:
+                logger.error(
+                    f"Error embedding batch of {len(batch.texts)} texts: {exc}"
+                )
+                raise exc
+            for index, vector in zip(batch.indices, vectors):
+                embeddings[index] = vector
+        return embeddings
+
+    async def _aembed_request(self, batch: EmbeddingBatch) -> List[List[float]]:
+        """
+        发起一次异步批量请求
+        由调度器控制限速、并发和重试，避免限流错误中断整个导入
+        """
+        try:
+            embeddings = await embedding_scheduler.run(
+                lambda: self._backend.aembed_texts(batch.texts),
+                tokens=batch.tokens,
+            )
+        except Exception as exc:
+            logger.error(f"Error embedding batch of {len(batch.texts)} texts: {exc}")
+            raise exc
+        logger.info(f"Embedded batch of {len(batch.texts)} texts")
+        return embeddings
+
+    async def aembed_sigle(self, text: str) -> List[float]:
+        embeddings = await self.aembed_batch([text])
+        return embeddings[0]
+
+    async def aembed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        异步批量编码，命中缓存的文本不再请求接口
+        返回结果与输入顺序一致
+        """
+        # SQLite读写放到线程中执行，避免阻塞事件循环
+        keys, cached, missing = await asyncio.to_thread(self._lookup_cache, texts)
+        vectors = await self._aembed_uncached(list(missing.values()))
+        fresh = dict(zip(missing, vectors))
+        if self._cache is not None:
+            await asyncio.to_thread(self._cache.put_many, fresh)
+        return [cached[key] if key in cached else fresh[key] for key in keys]
+
+    async def _aembed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """按token预算装箱，多个批次并发发起，不阻塞事件循环"""
+        batches = pack_batches(texts)
+        log_batch_utilization(batches, EMBEDDING_BATCH_MAX_TOKENS)
+        results = await asyncio.gather(
+            *(self._aembed_request(batch) for batch in batches)
+        )
+        embeddings: List[List[float]] = [None] * len(texts)
+        for batch, vectors in zip(batches, results):
+            for index, vector in zip(batch.indices, vectors):
+                embeddings[index] = vector
+        return embeddings
+
+    async def embed_query(self, text: str) -> List[float]:
+        """
+        编码用户查询，规范化后的查询文本命中进程内缓存时直接返回
+        未命中时交给微批调度器，与其他并发查询合并为一次请求
+        """
+        query = normalize_query(text)
+        vector = query_embedding_cache.get(query)
+        if vector is None:
+            vector = await self._get_batcher().submit(query)
+            query_embedding_cache.put(query, vector)
+        return vector
+
+    async def aembed(self, texts: str | List[str]):
+        """对文本进行异步编码"""
+        if not isinstance(texts, (str, list)):
+            raise ValueError(
+                "Invalid input type. Input must be a string or a list of strings."
+            )
+        if isinstance(texts, str):
+            return await self.aembed_sigle(texts)
+        return await self.aembed_batch(texts)
+
     def embed(self, texts: str | List[str]):
         """对文本进行编码"""
         if not isinstance(texts, (str, list)):
@@ -50,7 +302,7 @@ class EmbeddingModel:
             embedding = self.embed_sigle(texts)
             return embedding
         elif isinstance(texts, list):
-            embeddings = [self.embed_sigle(text) for text in texts]
+            embeddings = self.embed_batch(texts)
             return embeddings
 
 
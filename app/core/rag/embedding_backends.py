@@ -0,0 +1,147 @@
+import hashlib
+import os
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Type
+
+import numpy as np
+from dotenv import load_dotenv
+from loguru import logger
+from openai import NOT_GIVEN, AsyncOpenAI, OpenAI
+
+load_dotenv()
+
+# 嵌入后端配置，可选值见EMBEDDING_BACKENDS
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+# 本地哈希后端未配置EMBEDDING_DIM时使用的默认维度
+HASHING_EMBEDDING_DIM = 1024
+
+EMBEDDING_BACKENDS: Dict[str, Type["EmbeddingBackend"]] = {}
+
+
+def register_backend(name: str) -> Callable[[Type["EmbeddingBackend"]], Type]:
+    """注册嵌入后端，通过EMBEDDING_BACKEND按名称选择"""
+
+    def decorator(cls: Type["EmbeddingBackend"]):
+        cls.name = name
+        EMBEDDING_BACKENDS[name] = cls
+        return cls
+
+    return decorator
+
+
+def create_backend(name: Optional[str] = None) -> "EmbeddingBackend":
+    name = name or EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {name}, "
+            f"available: {', '.join(EMBEDDING_BACKENDS)}"
+        )
+    logger.info(f"Loading embedding backend: {name}")
+    return EMBEDDING_BACKENDS[name]()
+
+
+class EmbeddingBackend(ABC):
+    """
+    嵌入后端接口
+    每次调用对应一次上游请求，分批、并发和缓存由EmbeddingModel负责
+    """
+
+    name: str = ""
+    model_name: str = ""
+    dim: Optional[int] = None
+
+    @abstractmethod
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        pass
+
+    @abstractmethod
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        pass
+
+
+@register_backend("openai")
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """OpenAI兼容的HTTP嵌入接口"""
+
+    def __init__(self):
+        dim = os.getenv("EMBEDDING_DIM")
+        self.model_name = os.getenv("EMBEDDING_MODEL_NAME")
+        self.dim = int(dim) if dim else None
+        api_key = os.getenv("EMBEDDING_API_KEY")
+        base_url = os.getenv("EMBEDDING_BASE_URL")
+        self._client = OpenAI(api_key=api_key, base_url=base_url)
+        self._async_client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+
+    def _request_args(self, texts: List[str]) -> dict:
+        return {
+            "model": self.model_name,
+            "input": texts,
+            "dimensions": self.dim or NOT_GIVEN,
+            "encoding_format": "float",
+        }
+
+    @staticmethod
+    def _ordered(completion) -> List[List[float]]:
+        # 接口不保证data的顺序，按index重新排序
+        data = sorted(completion.data, key=lambda item: item.index)
+        return [item.embedding for item in data]
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        completion = self._client.embeddings.create(**self._request_args(texts))
+        return self._ordered(completion)
+
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        completion = await self._async_client.embeddings.create(
+            **self._request_args(texts)
+        )
+        return self._ordered(completion)
+
+
+_TOKEN_PATTERN = re.compile(r"[㐀-鿿豈-﫿]|[^\W_]+", re.UNICODE)
+
+
+@lru_cache(maxsize=65536)
+def _hash_feature(feature: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+@register_backend("hashing")
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    纯CPU的特征哈希嵌入，不依赖网络
+    以词（中文按单字）及相邻二元组为特征，带符号哈希到固定维度后做L2归一化
+    适用于压测、基准测试和CI，语义质量不能替代真实模型
+    """
+
+    def __init__(self, dim: Optional[int] = None):
+        env_dim = os.getenv("EMBEDDING_DIM")
+        self.dim = dim or (int(env_dim) if env_dim else HASHING_EMBEDDING_DIM)
+        self.model_name = f"feature-hashing-{self.dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        bigrams = [f"{a}\x1f{b}" for a, b in zip(tokens, tokens[1:])]
+        return tokens + bigrams
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter(
+                (_hash_feature(feature) for feature in self._features(text)),
+                dtype=np.uint64,
+            )
+            if hashes.size == 0:
+                continue
+            indices = (hashes % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], indices, signs)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix.tolist()
+
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_texts(texts)
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# 向量缓存配置
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+# 查询向量的进程内缓存配置
+QUERY_CACHE_CAPACITY = int(os.getenv("QUERY_CACHE_CAPACITY", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# SQLite单条语句的参数个数有上限，批量查询时分段执行
+_SQLITE_MAX_PARAMS = 500
+
+
+def normalize_query(text: str) -> str:
+    """统一全半角并折叠空白，使重复的问题得到相同的缓存键"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def make_cache_key(model_name: str, dim, text: str) -> str:
+    """根据模型名、维度和文本内容生成缓存键"""
+    raw = f"{model_name}\x1f{dim}\x1f{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    基于SQLite的持久化向量缓存
+    按内容寻址，超出容量时按最近访问时间淘汰
+    """
+
+    def __init__(self, path: str, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access "
+            "ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量读取缓存，命中的条目刷新访问时间"""
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(unique_keys), _SQLITE_MAX_PARAMS):
+                part = unique_keys[start : start + _SQLITE_MAX_PARAMS]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    part,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """
+        批量写入缓存，超出容量时淘汰最久未访问的条目
+        条目数根据新插入和淘汰的行数增量维护，不在每次写入时扫描全表
+        """
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_access) "
+                "VALUES (?, ?, ?)",
+                [
+                    (key, array("f", vector).tobytes(), now)
+                    for key, vector in items.items()
+                ],
+            ).rowcount
+            if inserted < len(items):
+                # 缓存键按内容寻址，已有条目的向量不变，只刷新访问时间
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in items],
+                )
+            self._size += inserted
+            if self._size > self.max_entries:
+                self._evict(self._size - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, count: int):
+        deleted = self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+            (count,),
+        ).rowcount
+        self._size -= deleted
+        logger.debug(f"Evicted {deleted} entries from embedding cache")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class QueryEmbeddingCache:
+    """
+    查询向量的进程内缓存，兼具TTL过期和LRU淘汰
+    只在事件循环线程中访问，不需要加锁
+    """
+
+    def __init__(
+        self, capacity: int = QUERY_CACHE_CAPACITY, ttl: float = QUERY_CACHE_TTL
+    ):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, List[float]]] = OrderedDict()
+
+    def get(self, query: str) -> Optional[List[float]]:
+        entry = self._entries.get(query)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[query]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(query)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, query: str, vector: List[float]):
+        if self.capacity <= 0:
+            return
+        self._entries[query] = (time.monotonic() + self.ttl, vector)
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        self._entries.clear()
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+query_embedding_cache = QueryEmbeddingCache()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """获取全局向量缓存，未启用时返回None"""
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        logger.info(f"Opening embedding cache at {EMBEDDING_CACHE_PATH}")
+        _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+    return _embedding_cache
@@ -0,0 +1,287 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from loguru import logger
+
+from .chunking import LeafChunk, Section
+from .dedup import PendingSignatures, get_signature_index
+from .embedding import EMBEDDING_BATCH_SIZE, EmbeddingModel
+from .vector_store import VectorRecord, get_vector_store, make_point_id
+
+load_dotenv()
+
+# 各阶段之间队列的容量（块数），队列满时上游阶段等待，内存占用不随文档大小增长
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "256"))
+# 并发的编码任务数，每个任务一次提交EMBEDDING_BATCH_SIZE个块
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "2"))
+
+# 队列结束标记
+_DONE = object()
+
+
+@dataclass
+class _PendingSection:
+    """等待所有叶子块编码完成的小节，向量为叶子向量的平均值"""
+
+    section: Section
+    expected: int = 0
+    received: int = 0
+    vector_sum: Optional[np.ndarray] = None
+
+
+async def _get_batch(queue: asyncio.Queue, size: int) -> List:
+    """阻塞取一个元素，再不等待地取出队列中已有的元素，凑满size或遇到结束标记为止"""
+    batch = [await queue.get()]
+    while len(batch) < size and batch[-1] is not _DONE and not queue.empty():
+        batch.append(queue.get_nowait())
+    return batch
+
+
+class IngestPipeline:
+    """
+    流式导入流水线：解析 → 分块 → 去重 → 编码 → 写入
+    各阶段作为独立任务并发执行，之间用有界队列连接，
+    前面的片段编码和写入时后面的片段在读取和分块，总耗时接近最慢的阶段
+    文档转换本身由处理器在转换进程中整篇完成，流水线从第一个片段产出时开始
+    """
+
+    def __init__(
+        self,
+        chunk: Callable[[str], List[str] | List[LeafChunk]],
+        source: str,
+        user_id: int,
+        file_id: int,
+        file_type: str,
+    ):
+        self.chunk = chunk
+        self.source = source
+        self.user_id = user_id
+        self.file_id = file_id
+        self.file_type = file_type
+        self.vector_store = get_vector_store()
+        self.embedding_model = EmbeddingModel()
+        self.signature_index = get_signature_index()
+        # 保留的块的签名，全部写入成功后才登记，导入失败不会影响之后的去重
+        self.signatures = PendingSignatures()
+        self.chunks: asyncio.Queue = asyncio.Queue(INGEST_QUEUE_SIZE)
+        self.records: asyncio.Queue = asyncio.Queue(INGEST_QUEUE_SIZE)
+        # 各阶段累计的工作耗时（不含等待队列的时间），用于定位瓶颈
+        self.busy: Dict[str, float] = dict.fromkeys(
+            ["parse", "chunk", "embed", "write"], 0.0
+        )
+        self.point_ids: List[str] = []
+        self.batches = 0
+        self.total_chunks = 0
+        self.duplicates = 0
+        self.sections: Dict[str, _PendingSection] = {}
+        self.section_points = 0
+
+    async def _parse_and_chunk(self, segments: AsyncIterator[str]):
+        chunk_index = 0
+        start = time.perf_counter()
+        async for segment in segments:
+            self.busy["parse"] += time.perf_counter() - start
+            start = time.perf_counter()
+            # 分块是CPU密集操作，放到线程中执行，不阻塞其他阶段
+            chunks = await asyncio.to_thread(self.chunk, segment)
+            leaves = [
+                chunk if isinstance(chunk, LeafChunk) else LeafChunk(chunk)
+                for chunk in chunks
+            ]
+            self.total_chunks += len(leaves)
+            if self.signature_index is not None:
+                # 与该用户已有的块近似重复的块不再编码和写入
+                duplicates = await asyncio.to_thread(
+                    self.signature_index.mark_duplicates,
+                    self.user_id,
+                    self.file_id,
+                    [leaf.text for leaf in leaves],
+                    self.signatures,
+                )
+                self.duplicates += sum(duplicates)
+                leaves = [
+                    leaf for leaf, duplicate in zip(leaves, duplicates) if not duplicate
+                ]
+            self.busy["chunk"] += time.perf_counter() - start
+            # 小节不跨片段，先登记片段内各小节的叶子数，写入阶段据此判断小节是否完整
+            for leaf in leaves:
+                if leaf.section is not None:
+                    section_id = self._section_point_id(leaf.section)
+                    pending = self.sections.setdefault(
+                        section_id, _PendingSection(leaf.section)
+                    )
+                    pending.expected += 1
+            for leaf in leaves:
+                await self.chunks.put((chunk_index, leaf))
+                chunk_index += 1
+            start = time.perf_counter()
+        for _ in range(INGEST_EMBED_WORKERS):
+            await self.chunks.put(_DONE)
+
+    async def _embed(self):
+        while True:
+            batch = await _get_batch(self.chunks, EMBEDDING_BATCH_SIZE)
+            done = batch[-1] is _DONE
+            items = batch[:-1] if done else batch
+            if items:
+                start = time.perf_counter()
+                vectors = await self.embedding_model.aembed_batch(
+                    [leaf.text for _, leaf in items]
+                )
+                self.busy["embed"] += time.perf_counter() - start
+                for (chunk_index, leaf), vector in zip(items, vectors):
+                    await self.records.put(self._make_record(chunk_index, leaf, vector))
+            if done:
+                await self.records.put(_DONE)
+                return
+
+    def _section_point_id(self, section: Section) -> str:
+        return make_point_id(
+            self.user_id, self.file_id, section.index, f"section\x1f{section.text}"
+        )
+
+    def _make_record(self, chunk_index: int, leaf: LeafChunk, vector) -> VectorRecord:
+        payload = {
+            "content": leaf.text,
+            "source": self.source,
+            "user_id": self.user_id,
+            "file_id": self.file_id,
+            "file_type": self.file_type,
+            "chunk_index": chunk_index,
+        }
+        if leaf.section_path:
+            payload["section_path"] = list(leaf.section_path)
+        if leaf.section is not None:
+            payload["parent_id"] = self._section_point_id(leaf.section)
+        return VectorRecord(
+            id=make_point_id(self.user_id, self.file_id, chunk_index, leaf.text),
+            vector=vector,
+            payload=payload,
+        )
+
+    def _complete_section(self, record: VectorRecord) -> Optional[VectorRecord]:
+        """累加叶子向量，小节的叶子全部到齐时返回小节记录"""
+        section_id = record.payload.get("parent_id")
+        if section_id is None:
+            return None
+        pending = self.sections[section_id]
+        vector = np.asarray(record.vector, dtype=np.float32)
+        pending.vector_sum = (
+            vector if pending.vector_sum is None else pending.vector_sum + vector
+        )
+        pending.received += 1
+        if pending.received < pending.expected:
+            return None
+        del self.sections[section_id]
+        self.section_points += 1
+        return VectorRecord(
+            id=section_id,
+            vector=(pending.vector_sum / pending.received).tolist(),
+            payload={
+                "content": pending.section.text,
+                "source": self.source,
+                "user_id": self.user_id,
+                "file_id": self.file_id,
+                "file_type": self.file_type,
+                "kind": "section",
+                "section_path": list(pending.section.path),
+            },
+        )
+
+    async def _flush(self, records: List[VectorRecord]):
+        start = time.perf_counter()
+        stats = await self.vector_store.upsert(records)
+        self.busy["write"] += time.perf_counter() - start
+        self.batches += stats["batches"]
+        self.point_ids.extend(record.id for record in records)
+
+    async def _write(self):
+        # 不支持增量写入的存储攒齐整个文件后一次写入
+        batch_size = self.vector_store.write_batch_size
+        pending: List[VectorRecord] = []
+        remaining = INGEST_EMBED_WORKERS
+        while remaining:
+            record = await self.records.get()
+            if record is _DONE:
+                remaining -= 1
+                continue
+            pending.append(record)
+            section = self._complete_section(record)
+            if section is not None:
+                pending.append(section)
+            if batch_size and len(pending) >= batch_size:
+                await self._flush(pending)
+                pending = []
+        if pending:
+            await self._flush(pending)
+
+    async def run(self, segments: AsyncIterator[str]) -> dict:
+        """
+        执行导入，任一阶段失败时取消其他阶段并抛出异常
+        全部写入成功后删除该文件不再存在的旧块，并登记去重签名
+        """
+        start = time.perf_counter()
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self._parse_and_chunk(segments))
+                for _ in range(INGEST_EMBED_WORKERS):
+                    group.create_task(self._embed())
+                group.create_task(self._write())
+        except ExceptionGroup as errors:
+            # 向调用方抛出首个失败阶段的原始异常
+            raise errors.exceptions[0]
+        removed = await self.vector_store.delete_stale(
+            self.user_id, self.file_id, self.point_ids
+        )
+        if self.signature_index is not None:
+            await asyncio.to_thread(
+                self.signature_index.replace_file,
+                self.user_id,
+                self.file_id,
+                self.signatures.signatures,
+            )
+        elapsed = time.perf_counter() - start
+        return {
+            "points": len(self.point_ids),
+            "sections": self.section_points,
+            "duplicates": self.duplicates,
+            "dedup_ratio": (
+                self.duplicates / self.total_chunks if self.total_chunks else 0.0
+            ),
+            "batches": self.batches,
+            "removed": removed,
+            "seconds": elapsed,
+            "points_per_second": len(self.point_ids) / elapsed if elapsed else 0.0,
+            "stage_seconds": dict(self.busy),
+        }
+
+
+async def ingest_document(
+    segments: AsyncIterator[str],
+    chunk: Callable[[str], List[str]],
+    source: str,
+    user_id: int,
+    file_id: int,
+    file_type: str,
+) -> dict:
+    """将文档片段流式地分块、编码并写入向量库，返回导入统计"""
+    pipeline = IngestPipeline(chunk, source, user_id, file_id, file_type)
+    stats = await pipeline.run(segments)
+    stages = ", ".join(
+        f"{name} {seconds:.2f}s" for name, seconds in stats["stage_seconds"].items()
+    )
+    logger.info(
+        f"Stored {stats['points']} points ({stats['sections']} sections) "
+        f"to {pipeline.vector_store.name} "
+        f"for user {user_id} in {stats['batches']} batches, {stats['seconds']:.2f}s "
+        f"({stats['points_per_second']:.0f} points/s; {stages}), "
+        f"skipped {stats['duplicates']} near-duplicate chunks "
+        f"(dedup ratio {stats['dedup_ratio']:.1%}), "
+        f"removed {stats['removed']} stale chunks of file {file_id}"
+    )
+    return stats
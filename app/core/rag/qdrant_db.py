@@ -1,51 +1,629 @@
+import asyncio
 import os
+import sys
+import time
+from typing import List, Optional
 
+import httpx
 from dotenv import load_dotenv
 from loguru import logger
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Disabled,
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    Fusion,
+    FusionQuery,
+    HasIdCondition,
+    HnswConfigDiff,
+    IntegerIndexParams,
+    IntegerIndexType,
+    KeywordIndexParams,
+    KeywordIndexType,
+    MatchValue,
+    Modifier,
+    PointStruct,
+    Prefetch,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    SparseVectorParams,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from ...schemas.retrieval import RetrievalOptions
+from .sparse import encode_document, encode_query
 
 load_dotenv()
 
 # Qdrant配置
 QDRANT_HOST = os.getenv("QDRANT_HOST")
-QDRANT_PORT = int(os.getenv("QDRANT_PORT"))
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME")
-VECTOR_SIZE = int(os.getenv("VECTOR_SIZE"))
+VECTOR_SIZE = int(os.getenv("VECTOR_SIZE", os.getenv("EMBEDDING_DIM", "1536")))
+# 向量存储与索引配置
+QDRANT_QUANTIZATION = os.getenv("QDRANT_QUANTIZATION", "none").lower()
+QDRANT_QUANTIZATION_ALWAYS_RAM = (
+    os.getenv("QDRANT_QUANTIZATION_ALWAYS_RAM", "True").lower() == "true"
+)
+QDRANT_ON_DISK_VECTORS = os.getenv("QDRANT_ON_DISK_VECTORS", "False").lower() == "true"
+QDRANT_HNSW_M = int(os.getenv("QDRANT_HNSW_M", "16"))
+QDRANT_HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100"))
+# 量化检索时先用量化向量多取候选，再用原始向量重新打分
+QDRANT_RESCORE = os.getenv("QDRANT_RESCORE", "True").lower() == "true"
+QDRANT_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING", "2.0"))
+# 检索参数默认值，可被单次请求的RetrievalOptions覆盖；QDRANT_HNSW_EF为0时使用集合的默认值
+RETRIEVAL_LIMIT = int(os.getenv("RETRIEVAL_LIMIT", "5"))
+QDRANT_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF", "0"))
+QDRANT_EXACT_SEARCH = os.getenv("QDRANT_EXACT_SEARCH", "False").lower() == "true"
+RETRIEVAL_SCORE_THRESHOLD = (
+    float(os.getenv("RETRIEVAL_SCORE_THRESHOLD"))
+    if os.getenv("RETRIEVAL_SCORE_THRESHOLD")
+    else None
+)
+# 分层分块时将命中的叶子块扩展为所在小节
+RETRIEVAL_EXPAND_SECTIONS = (
+    os.getenv("RETRIEVAL_EXPAND_SECTIONS", "True").lower() == "true"
+)
+# 两阶段检索：低维截断向量召回候选，全维向量重新打分
+QDRANT_TWO_STAGE = os.getenv("QDRANT_TWO_STAGE", "False").lower() == "true"
+QDRANT_PREFETCH_DIM = int(os.getenv("QDRANT_PREFETCH_DIM", "256"))
+QDRANT_PREFETCH_MULTIPLIER = int(os.getenv("QDRANT_PREFETCH_MULTIPLIER", "8"))
+# 混合检索：稠密向量与BM25稀疏向量分别召回候选，在同一次请求中用RRF融合
+QDRANT_HYBRID = os.getenv("QDRANT_HYBRID", "False").lower() == "true"
+# 批量写入配置：每批点数与并行写入数
+QDRANT_UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+QDRANT_UPSERT_PARALLEL = int(os.getenv("QDRANT_UPSERT_PARALLEL", "2"))
+# 传输方式：gRPC省去JSON编解码，适合携带全文和高维向量的请求
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "False").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_GRPC_MAX_MESSAGE_MB = int(os.getenv("QDRANT_GRPC_MAX_MESSAGE_MB", "64"))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "30"))
+# 连接池大小：REST为共享的keep-alive连接数，gRPC为channel数
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", "16"))
+QDRANT_GRPC_POOL_SIZE = int(os.getenv("QDRANT_GRPC_POOL_SIZE", "3"))
+# 后台连接任务：未就绪时按指数退避重连，就绪后定期探活
+QDRANT_RECONNECT_INTERVAL = float(os.getenv("QDRANT_RECONNECT_INTERVAL", "1"))
+QDRANT_RECONNECT_MAX_INTERVAL = float(os.getenv("QDRANT_RECONNECT_MAX_INTERVAL", "30"))
+QDRANT_HEALTH_CHECK_INTERVAL = float(os.getenv("QDRANT_HEALTH_CHECK_INTERVAL", "15"))
+# 已有集合的配置与期望不一致时是否在启动时自动迁移
+QDRANT_AUTO_MIGRATE = os.getenv("QDRANT_AUTO_MIGRATE", "False").lower() == "true"
+
+
+# 载荷索引：检索时按user_id和kind过滤，导入和清理时按file_id、source、file_type、chunk_index定位
+PAYLOAD_INDEXES = {
+    "user_id": IntegerIndexParams(
+        type=IntegerIndexType.INTEGER, lookup=True, range=False
+    ),
+    "file_id": IntegerIndexParams(
+        type=IntegerIndexType.INTEGER, lookup=True, range=False
+    ),
+    "source": KeywordIndexParams(type=KeywordIndexType.KEYWORD),
+    "file_type": KeywordIndexParams(type=KeywordIndexType.KEYWORD),
+    "chunk_index": IntegerIndexParams(
+        type=IntegerIndexType.INTEGER, lookup=True, range=True
+    ),
+    "kind": KeywordIndexParams(type=KeywordIndexType.KEYWORD),
+}
+# 分层分块中小节点的kind，只用于命中后扩展上下文，不参与检索
+SECTION_KIND = "section"
+
+# 两阶段检索使用的命名向量
+DENSE_VECTOR_NAME = "dense"
+PREFETCH_VECTOR_NAME = "dense_prefetch"
+# 混合检索使用的稀疏向量
+SPARSE_VECTOR_NAME = "sparse"
+
+
+def truncate_vector(vector: List[float], dim: int = QDRANT_PREFETCH_DIM) -> List[float]:
+    """
+    截取向量前dim维并重新归一化
+    适用于Matryoshka方式训练的嵌入模型，前若干维本身就是有效的低维表示
+    """
+    head = vector[:dim]
+    norm = sum(value * value for value in head) ** 0.5
+    return [value / norm for value in head] if norm else head
+
+
+def build_vectors_config():
+    """两阶段检索时集合包含全维和低维两个命名向量，否则为单个默认向量"""
+    if not QDRANT_TWO_STAGE:
+        return VectorParams(
+            size=VECTOR_SIZE, distance=Distance.COSINE, on_disk=QDRANT_ON_DISK_VECTORS
+        )
+    return {
+        DENSE_VECTOR_NAME: VectorParams(
+            size=VECTOR_SIZE, distance=Distance.COSINE, on_disk=QDRANT_ON_DISK_VECTORS
+        ),
+        # 低维向量用于第一阶段召回，常驻内存
+        PREFETCH_VECTOR_NAME: VectorParams(
+            size=QDRANT_PREFETCH_DIM, distance=Distance.COSINE, on_disk=False
+        ),
+    }
+
+
+def build_client_args(prefer_grpc: bool = QDRANT_PREFER_GRPC) -> dict:
+    """生成AsyncQdrantClient的连接参数"""
+    args = {
+        "host": QDRANT_HOST,
+        "port": QDRANT_PORT,
+        "grpc_port": QDRANT_GRPC_PORT,
+        "prefer_grpc": prefer_grpc,
+        "timeout": QDRANT_TIMEOUT,
+    }
+    if prefer_grpc:
+        # gRPC默认单条消息上限4MB，大批量写入会超出
+        max_message = QDRANT_GRPC_MAX_MESSAGE_MB * 1024 * 1024
+        args["pool_size"] = QDRANT_GRPC_POOL_SIZE
+        args["grpc_options"] = {
+            "grpc.max_send_message_length": max_message,
+            "grpc.max_receive_message_length": max_message,
+        }
+    else:
+        args["limits"] = httpx.Limits(
+            max_connections=QDRANT_POOL_SIZE,
+            max_keepalive_connections=QDRANT_POOL_SIZE,
+        )
+    return args
+
+
+def build_sparse_vectors_config():
+    """混合检索时添加稀疏向量，IDF由Qdrant根据集合统计计算"""
+    if not QDRANT_HYBRID:
+        return None
+    return {SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)}
+
+
+def build_point_vector(vector: List[float], text: str = ""):
+    """生成写入Qdrant的点向量，混合检索时同时计算text的稀疏向量"""
+    hybrid = qdrant_client_manager.hybrid
+    if not QDRANT_TWO_STAGE and not hybrid:
+        return vector
+    if QDRANT_TWO_STAGE:
+        vectors = {
+            DENSE_VECTOR_NAME: vector,
+            PREFETCH_VECTOR_NAME: truncate_vector(vector),
+        }
+    else:
+        # 默认向量在命名向量字典中的名称为空字符串
+        vectors = {"": vector}
+    if hybrid:
+        vectors[SPARSE_VECTOR_NAME] = encode_document(text)
+    return vectors
+
+
+def _dense_query(query_vector: List[float], limit: int, params) -> dict:
+    """稠密向量检索参数，键名与Prefetch一致"""
+    if not QDRANT_TWO_STAGE:
+        return {"query": query_vector, "limit": limit, "params": params}
+    return {
+        "prefetch": Prefetch(
+            query=truncate_vector(query_vector),
+            using=PREFETCH_VECTOR_NAME,
+            limit=limit * QDRANT_PREFETCH_MULTIPLIER,
+            params=params,
+        ),
+        "query": query_vector,
+        "using": DENSE_VECTOR_NAME,
+        "limit": limit,
+    }
+
+
+def build_search_filter(user_id: Optional[int] = None) -> Filter:
+    """检索过滤条件：排除小节点，指定user_id时只检索该用户的数据"""
+    return Filter(
+        must=(
+            [FieldCondition(key="user_id", match=MatchValue(value=user_id))]
+            if user_id is not None
+            else None
+        ),
+        must_not=[FieldCondition(key="kind", match=MatchValue(value=SECTION_KIND))],
+    )
+
+
+def build_query_args(
+    query_vector: List[float],
+    query_filter: Filter | dict,
+    limit: int,
+    query_text: str = "",
+    options: Optional[RetrievalOptions] = None,
+):
+    """
+    生成query_points的检索参数
+    两阶段检索时先用低维向量召回limit * QDRANT_PREFETCH_MULTIPLIER个候选，
+    再在同一次请求中用全维向量对候选重新打分，query_filter会同时作用于预取阶段
+    混合检索时稠密和稀疏两路各召回limit * QDRANT_PREFETCH_MULTIPLIER个候选，
+    由Qdrant按RRF融合排序，只需一次请求
+    options中的检索参数作用于稠密向量检索，score_threshold是余弦相似度的下限，
+    混合检索时只作用于稠密召回，RRF得分只取决于排名，不能与相似度阈值比较
+    """
+    params = build_search_params(options)
+    score_threshold = resolve_option(options, "score_threshold")
+    if qdrant_client_manager.hybrid and query_text:
+        candidates = limit * QDRANT_PREFETCH_MULTIPLIER
+        return {
+            "prefetch": [
+                Prefetch(
+                    **_dense_query(query_vector, candidates, params),
+                    score_threshold=score_threshold,
+                ),
+                Prefetch(
+                    query=encode_query(query_text),
+                    using=SPARSE_VECTOR_NAME,
+                    limit=candidates,
+                ),
+            ],
+            "query": FusionQuery(fusion=Fusion.RRF),
+            "query_filter": query_filter,
+            "limit": limit,
+        }
+    args = _dense_query(query_vector, limit, params)
+    args["search_params"] = args.pop("params", None)
+    args["query_filter"] = query_filter
+    args["score_threshold"] = score_threshold
+    return args
+
+
+def build_quantization_config():
+    """根据QDRANT_QUANTIZATION生成量化配置，未启用时返回None"""
+    if QDRANT_QUANTIZATION == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=0.99,
+                always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM,
+            )
+        )
+    if QDRANT_QUANTIZATION == "binary":
+        return BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=QDRANT_QUANTIZATION_ALWAYS_RAM)
+        )
+    if QDRANT_QUANTIZATION not in ("", "none"):
+        raise ValueError(f"Unsupported QDRANT_QUANTIZATION: {QDRANT_QUANTIZATION}")
+    return None
+
+
+# RetrievalOptions字段对应的服务端默认值
+RETRIEVAL_DEFAULTS = {
+    "limit": RETRIEVAL_LIMIT,
+    "hnsw_ef": QDRANT_HNSW_EF or None,
+    "exact": QDRANT_EXACT_SEARCH,
+    "rescore": QDRANT_RESCORE,
+    "oversampling": QDRANT_OVERSAMPLING,
+    "score_threshold": RETRIEVAL_SCORE_THRESHOLD,
+    "expand_sections": RETRIEVAL_EXPAND_SECTIONS,
+}
+
+
+def resolve_option(options: Optional[RetrievalOptions], name: str):
+    """读取请求中的检索参数，未设置时返回服务端默认值"""
+    value = getattr(options, name, None) if options else None
+    return RETRIEVAL_DEFAULTS[name] if value is None else value
+
+
+def build_search_params(
+    options: Optional[RetrievalOptions] = None,
+) -> SearchParams | None:
+    """生成HNSW与精确检索参数，启用量化时开启原始向量重打分"""
+    hnsw_ef = resolve_option(options, "hnsw_ef")
+    exact = resolve_option(options, "exact")
+    quantization = None
+    if build_quantization_config() is not None:
+        quantization = QuantizationSearchParams(
+            rescore=resolve_option(options, "rescore"),
+            oversampling=resolve_option(options, "oversampling"),
+        )
+    if hnsw_ef is None and not exact and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+
+async def upsert_points_bulk(
+    points: List[PointStruct],
+    batch_size: int = QDRANT_UPSERT_BATCH_SIZE,
+    parallel: int = QDRANT_UPSERT_PARALLEL,
+) -> dict:
+    """
+    分批写入点，返回写入统计
+    除最后一批外均以wait=False并行提交，最后一批wait=True作为一致性屏障：
+    Qdrant按顺序应用更新，最后一批完成时之前提交的批次也已生效
+    """
+    start = time.perf_counter()
+    batches = [points[i : i + batch_size] for i in range(0, len(points), batch_size)]
+    if batches:
+        semaphore = asyncio.Semaphore(parallel)
+
+        client = await qdrant_client_manager.get_ready_client()
+
+        async def write(batch: List[PointStruct], wait: bool):
+            async with semaphore:
+                await client.upsert(
+                    collection_name=QDRANT_COLLECTION_NAME,
+                    points=batch,
+                    wait=wait,
+                )
+
+        await asyncio.gather(*(write(batch, False) for batch in batches[:-1]))
+        await write(batches[-1], True)
+    elapsed = time.perf_counter() - start
+    return {
+        "points": len(points),
+        "batches": len(batches),
+        "seconds": elapsed,
+        "points_per_second": len(points) / elapsed if elapsed else 0.0,
+    }
+
+
+async def delete_stale_points(user_id: int, file_id: int, keep_ids: List[str]) -> int:
+    """
+    删除文件中不在keep_ids里的旧点，返回删除的点数
+    在新的点写入之后调用，重新导入期间检索不会出现空窗
+    """
+    client = await qdrant_client_manager.get_ready_client()
+    stale_filter = Filter(
+        must=[
+            FieldCondition(key="user_id", match=MatchValue(value=user_id)),
+            FieldCondition(key="file_id", match=MatchValue(value=file_id)),
+        ],
+        must_not=[HasIdCondition(has_id=keep_ids)] if keep_ids else None,
+    )
+    stale = await client.count(
+        collection_name=QDRANT_COLLECTION_NAME, count_filter=stale_filter, exact=True
+    )
+    if stale.count:
+        await client.delete(
+            collection_name=QDRANT_COLLECTION_NAME,
+            points_selector=FilterSelector(filter=stale_filter),
+            wait=True,
+        )
+    return stale.count
+
+
+class QdrantUnavailableError(ConnectionError):
+    """Qdrant未就绪，后台任务正在重连，请求直接失败而不等待"""
 
 
 class QdrantClientManager:
+    """
+    Qdrant异步客户端管理器
+    客户端在首次使用时创建，集合初始化推迟到首次请求或后台连接任务中进行，
+    导入模块和进程启动都不依赖Qdrant可用
+    """
+
     _instance = None
     _client = None
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(QdrantClientManager, cls).__new__(cls)
+            cls._instance.ready = False
+            # 已有集合缺少稀疏向量时关闭混合检索
+            cls._instance.hybrid = QDRANT_HYBRID
+            cls._instance.last_error = None
+            cls._instance._init_lock = None
+            cls._instance._monitor_task = None
         return cls._instance
 
-    def get_client(self):
+    def get_client(self) -> AsyncQdrantClient:
+        """创建客户端对象，不发起网络请求"""
         if self._client is None:
-            self._client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
-            self._initialize_collection()
+            self._client = AsyncQdrantClient(**build_client_args())
         return self._client
 
-    def _initialize_collection(self):
-        """初始化集合"""
+    async def get_ready_client(self) -> AsyncQdrantClient:
+        """
+        返回已完成集合初始化的客户端
+        后台任务运行时由其负责重连，未就绪的请求立即失败，不在初始化锁上排队；
+        没有后台任务时（脚本、测试）当场尝试初始化
+        """
+        if not self.ready:
+            if self._monitor_task is not None and not self._monitor_task.done():
+                raise QdrantUnavailableError(
+                    f"Qdrant is not ready: {self.last_error or 'connecting'}"
+                )
+            await self.ensure_ready()
+        return self.get_client()
+
+    async def ensure_ready(self):
+        """初始化集合，多个请求同时触发时只执行一次"""
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+        async with self._init_lock:
+            if self.ready:
+                return
+            try:
+                await self._initialize_collection()
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            self.ready = True
+            self.last_error = None
+            logger.info(f"Qdrant collection {QDRANT_COLLECTION_NAME} is ready")
+
+    async def check(self) -> bool:
+        """
+        探测Qdrant是否可用，连接失败或集合被删除时标记为未就绪，
+        由后台任务重新初始化
+        """
         try:
-            # 检查集合是否存在
-            collection_info = self._client.get_collection(
-                collection_name=QDRANT_COLLECTION_NAME
-            )
-            logger.info(f"Collection {QDRANT_COLLECTION_NAME} already exists")
-        except Exception:
+            exists = await self.get_client().collection_exists(QDRANT_COLLECTION_NAME)
+        except Exception as e:
+            self.ready = False
+            self.last_error = str(e)
+            return False
+        if not exists:
+            self.ready = False
+            self.last_error = f"Collection {QDRANT_COLLECTION_NAME} does not exist"
+            return False
+        return self.ready
+
+    async def _monitor(self):
+        delay = QDRANT_RECONNECT_INTERVAL
+        while True:
+            if self.ready:
+                await asyncio.sleep(QDRANT_HEALTH_CHECK_INTERVAL)
+                if not await self.check():
+                    logger.warning(f"Qdrant became unavailable: {self.last_error}")
+                continue
+            try:
+                await self.ensure_ready()
+                delay = QDRANT_RECONNECT_INTERVAL
+            except RuntimeError:
+                # 向量布局不一致需要人工处理，重试没有意义
+                logger.exception("Qdrant collection initialization failed")
+                return
+            except Exception as e:
+                logger.warning(f"Qdrant is not available ({e}), retry in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, QDRANT_RECONNECT_MAX_INTERVAL)
+
+    def start(self):
+        """在后台连接Qdrant并持续探活，断开后自动重连"""
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def close(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            try:
+                await self._monitor_task
+            except asyncio.CancelledError:
+                pass
+            self._monitor_task = None
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        self.ready = False
+
+    async def _initialize_collection(self):
+        """初始化集合"""
+        client = self.get_client()
+        if not await client.collection_exists(QDRANT_COLLECTION_NAME):
             # 集合不存在，创建新集合
             logger.info(f"Creating collection {QDRANT_COLLECTION_NAME}")
-            self._client.create_collection(
+            await client.create_collection(
+                collection_name=QDRANT_COLLECTION_NAME,
+                vectors_config=build_vectors_config(),
+                sparse_vectors_config=build_sparse_vectors_config(),
+                hnsw_config=HnswConfigDiff(
+                    m=QDRANT_HNSW_M, ef_construct=QDRANT_HNSW_EF_CONSTRUCT
+                ),
+                quantization_config=build_quantization_config(),
+            )
+            await self._ensure_payload_indexes()
+            return
+
+        logger.info(f"Collection {QDRANT_COLLECTION_NAME} already exists")
+        collection_info = await client.get_collection(QDRANT_COLLECTION_NAME)
+        if isinstance(collection_info.config.params.vectors, dict) != QDRANT_TWO_STAGE:
+            # 默认向量和命名向量之间无法原地转换，需要重建集合并重新导入
+            raise RuntimeError(
+                f"Collection {QDRANT_COLLECTION_NAME} vector layout does not match "
+                f"QDRANT_TWO_STAGE={QDRANT_TWO_STAGE}, recreate the collection "
+                "and re-ingest documents"
+            )
+        sparse_vectors = collection_info.config.params.sparse_vectors or {}
+        if QDRANT_HYBRID and SPARSE_VECTOR_NAME not in sparse_vectors:
+            # 已有集合无法原地添加新的命名向量，重建集合并重新导入后才能启用
+            self.hybrid = False
+            logger.warning(
+                f"Collection {QDRANT_COLLECTION_NAME} has no sparse vector, "
+                "hybrid retrieval is disabled until the collection is recreated "
+                "and documents are re-ingested"
+            )
+        if self._collection_config_outdated(collection_info):
+            if QDRANT_AUTO_MIGRATE:
+                await self.migrate_collection()
+            else:
+                # 继续使用已有集合，检索可用但不具备配置的存储与索引特性
+                logger.error(
+                    f"Collection {QDRANT_COLLECTION_NAME} storage settings differ "
+                    "from configuration, run `python -m app.core.rag.qdrant_db "
+                    "migrate` or set QDRANT_AUTO_MIGRATE=True to apply them"
+                )
+        await self._ensure_payload_indexes()
+
+    async def _ensure_payload_indexes(self):
+        """
+        创建缺失的载荷索引并校验
+        有了索引后Qdrant会为过滤字段构建额外的HNSW连接，按用户过滤的检索不会随用户数增加而退化
+        """
+        client = self.get_client()
+        schema = (await client.get_collection(QDRANT_COLLECTION_NAME)).payload_schema
+        for field_name, params in PAYLOAD_INDEXES.items():
+            if field_name in schema:
+                if schema[field_name].data_type.value != params.type.value:
+                    logger.error(
+                        f"Payload index on {field_name} has type "
+                        f"{schema[field_name].data_type.value}, "
+                        f"expected {params.type.value}"
+                    )
+                continue
+            logger.info(f"Creating payload index on {field_name}")
+            await client.create_payload_index(
                 collection_name=QDRANT_COLLECTION_NAME,
-                vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
+                field_name=field_name,
+                field_schema=params,
             )
 
+        schema = (await client.get_collection(QDRANT_COLLECTION_NAME)).payload_schema
+        missing = set(PAYLOAD_INDEXES) - set(schema)
+        if missing:
+            # 缺少索引时检索仍然可用，只是过滤性能下降，因此不阻止启动
+            logger.error(f"Missing payload indexes: {', '.join(sorted(missing))}")
 
-# 全局客户端实例
+    def _collection_config_outdated(self, collection_info) -> bool:
+        """比较已有集合的存储与索引配置是否与当前配置一致"""
+        vectors = collection_info.config.params.vectors
+        dense = vectors[DENSE_VECTOR_NAME] if QDRANT_TWO_STAGE else vectors
+        hnsw = collection_info.config.hnsw_config
+        quantization = build_quantization_config()
+        current_quantization = collection_info.config.quantization_config
+        return (
+            bool(dense.on_disk) != QDRANT_ON_DISK_VECTORS
+            or hnsw.m != QDRANT_HNSW_M
+            or hnsw.ef_construct != QDRANT_HNSW_EF_CONSTRUCT
+            or type(current_quantization) is not type(quantization)
+        )
+
+    async def migrate_collection(self):
+        """
+        将已有集合迁移到当前的存储与索引配置
+        Qdrant在后台重建索引和量化数据，迁移期间集合仍可读写
+        """
+        logger.info(f"Migrating collection {QDRANT_COLLECTION_NAME} storage settings")
+        await self.get_client().update_collection(
+            collection_name=QDRANT_COLLECTION_NAME,
+            vectors_config={
+                DENSE_VECTOR_NAME if QDRANT_TWO_STAGE else "": VectorParamsDiff(
+                    on_disk=QDRANT_ON_DISK_VECTORS
+                )
+            },
+            hnsw_config=HnswConfigDiff(
+                m=QDRANT_HNSW_M, ef_construct=QDRANT_HNSW_EF_CONSTRUCT
+            ),
+            quantization_config=build_quantization_config() or Disabled.DISABLED,
+        )
+
+
+# 全局客户端管理器，导入时不连接Qdrant
 qdrant_client_manager = QdrantClientManager()
-qdrant_client = qdrant_client_manager.get_client()
+
+
+async def _migrate():
+    try:
+        await qdrant_client_manager.migrate_collection()
+    finally:
+        await qdrant_client_manager.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        asyncio.run(_migrate())
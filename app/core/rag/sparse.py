@@ -0,0 +1,80 @@
+import hashlib
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from qdrant_client.models import SparseVector
+
+load_dotenv()
+
+# BM25参数，IDF由Qdrant在检索时按集合统计计算
+SPARSE_BM25_K1 = float(os.getenv("SPARSE_BM25_K1", "1.2"))
+SPARSE_BM25_B = float(os.getenv("SPARSE_BM25_B", "0.75"))
+# 写入时无法得知全集合的平均文档长度，用配置的平均块长度（token数）近似
+SPARSE_AVG_DOC_LENGTH = float(os.getenv("SPARSE_AVG_DOC_LENGTH", "256"))
+
+# 连续的中日韩字符，或由字母数字组成、可用-_./连接的编号（如SKU-1024、v2.1）
+_CJK_RUN = r"[㐀-䶿一-鿿豈-﫿]+"
+_IDENTIFIER = r"[a-z0-9]+(?:[-_./][a-z0-9]+)*"
+_TOKEN_PATTERN = re.compile(f"({_CJK_RUN})|({_IDENTIFIER})")
+_IDENTIFIER_PARTS = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    面向中文的分词
+    中文不做词典切分，输出单字和相邻二字组合；编号整体保留，同时输出其组成部分，
+    这样查询“SKU-1024”和“1024”都能命中
+    """
+    tokens = []
+    text = unicodedata.normalize("NFKC", text).lower()
+    for cjk, identifier in _TOKEN_PATTERN.findall(text):
+        if cjk:
+            tokens.extend(cjk)
+            tokens.extend(cjk[i : i + 2] for i in range(len(cjk) - 1))
+        else:
+            tokens.append(identifier)
+            parts = _IDENTIFIER_PARTS.findall(identifier)
+            if len(parts) > 1:
+                tokens.extend(parts)
+    return tokens
+
+
+def token_index(token: str) -> int:
+    """将词项哈希到uint32索引，无需维护词表"""
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _term_frequencies(text: str) -> Dict[int, int]:
+    # 哈希冲突的词项合并计数
+    frequencies: Dict[int, int] = Counter()
+    for token in tokenize(text):
+        frequencies[token_index(token)] += 1
+    return frequencies
+
+
+def encode_document(text: str) -> SparseVector:
+    """计算文档的BM25词频权重"""
+    frequencies = _term_frequencies(text)
+    length = sum(frequencies.values())
+    norm = SPARSE_BM25_K1 * (
+        1 - SPARSE_BM25_B + SPARSE_BM25_B * length / SPARSE_AVG_DOC_LENGTH
+    )
+    indices = sorted(frequencies)
+    return SparseVector(
+        indices=indices,
+        values=[
+            frequencies[i] * (SPARSE_BM25_K1 + 1) / (frequencies[i] + norm)
+            for i in indices
+        ],
+    )
+
+
+def encode_query(text: str) -> SparseVector:
+    """查询中每个词项权重为1，得分即命中词项的BM25权重乘IDF之和"""
+    indices = sorted(_term_frequencies(text))
+    return SparseVector(indices=indices, values=[1.0] * len(indices))
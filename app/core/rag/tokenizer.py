@@ -0,0 +1,53 @@
+import os
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from chonkie import AutoTokenizer
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# 嵌入模型对应的分词器，可以是tiktoken编码名（如cl100k_base）或HuggingFace分词器名
+# 未配置时按EMBEDDING_MODEL_NAME查找，都加载不到时退回字符估算
+EMBEDDING_TOKENIZER = os.getenv("EMBEDDING_TOKENIZER", "")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符按每字一个token，其余按每4个字符一个token"""
+    cjk = sum(1 for char in text if "\u3400" <= char <= "\u9fff")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _load_tokenizer(name: str) -> Optional[Callable[[str], int]]:
+    try:
+        return AutoTokenizer(name).count_tokens
+    except Exception:
+        pass
+    try:
+        # OpenAI的模型名需要先映射到对应的编码
+        import tiktoken
+
+        encoding = tiktoken.encoding_for_model(name)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(name: Optional[str] = None) -> Callable[[str], int]:
+    """获取嵌入模型的token计数函数，结果按名称缓存"""
+    name = name or EMBEDDING_TOKENIZER or os.getenv("EMBEDDING_MODEL_NAME") or ""
+    counter = _load_tokenizer(name) if name else None
+    if counter is None:
+        logger.warning(
+            f"Tokenizer for '{name}' is not available, falling back to estimation"
+        )
+        return estimate_tokens
+    logger.info(f"Loaded tokenizer for '{name}'")
+    return counter
+
+
+def count_tokens(texts: List[str]) -> int:
+    counter = get_token_counter()
+    return sum(counter(text) for text in texts)
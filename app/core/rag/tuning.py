@@ -0,0 +1,90 @@
+import statistics
+import time
+from typing import List, Optional
+
+from qdrant_client.models import QuantizationSearchParams, SearchParams
+
+from ...schemas.retrieval import RetrievalBenchmarkResult, RetrievalOptions
+from .embedding import EmbeddingModel
+from .qdrant_db import (
+    DENSE_VECTOR_NAME,
+    QDRANT_COLLECTION_NAME,
+    QDRANT_TWO_STAGE,
+    build_query_args,
+    build_search_filter,
+    qdrant_client_manager,
+    resolve_option,
+)
+
+# 未指定扫描组合时比较的hnsw_ef取值
+DEFAULT_HNSW_EF_SWEEP = [16, 32, 64, 128, 256]
+
+
+def default_sweep() -> List[RetrievalOptions]:
+    return [RetrievalOptions(hnsw_ef=hnsw_ef) for hnsw_ef in DEFAULT_HNSW_EF_SWEEP]
+
+
+def percentile(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def _exact_ids(client, query_vector, query_filter, limit: int) -> set:
+    """用全维原始向量精确检索的结果作为召回率的基准"""
+    result = await client.query_points(
+        collection_name=QDRANT_COLLECTION_NAME,
+        query=query_vector,
+        using=DENSE_VECTOR_NAME if QDRANT_TWO_STAGE else None,
+        query_filter=query_filter,
+        limit=limit,
+        search_params=SearchParams(
+            exact=True, quantization=QuantizationSearchParams(ignore=True)
+        ),
+        with_payload=False,
+    )
+    return {point.id for point in result.points}
+
+
+async def benchmark_retrieval(
+    queries: List[str],
+    user_id: Optional[int] = None,
+    options_list: Optional[List[RetrievalOptions]] = None,
+) -> List[RetrievalBenchmarkResult]:
+    """
+    对每组检索参数统计查询延迟的p50/p95和相对精确检索的召回率
+    只评估稠密向量检索，混合检索的稀疏通道和RRF融合不参与比较
+    """
+    client = await qdrant_client_manager.get_ready_client()
+    query_vectors = await EmbeddingModel().aembed(queries)
+    query_filter = build_search_filter(user_id)
+
+    # 精确检索的基准结果按limit缓存，不同参数组合共用
+    expected_ids = {}
+    results = []
+    for options in options_list or default_sweep():
+        limit = resolve_option(options, "limit")
+        latencies, recalls = [], []
+        for i, query_vector in enumerate(query_vectors):
+            if (i, limit) not in expected_ids:
+                expected_ids[i, limit] = await _exact_ids(
+                    client, query_vector, query_filter, limit
+                )
+            expected = expected_ids[i, limit]
+            args = build_query_args(query_vector, query_filter, limit, options=options)
+            start = time.perf_counter()
+            result = await client.query_points(
+                collection_name=QDRANT_COLLECTION_NAME, with_payload=False, **args
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            found = {point.id for point in result.points}
+            recalls.append(len(found & expected) / len(expected) if expected else 1.0)
+        results.append(
+            RetrievalBenchmarkResult(
+                options=options,
+                p50_ms=percentile(latencies, 50),
+                p95_ms=percentile(latencies, 95),
+                recall=statistics.mean(recalls),
+            )
+        )
+    return results
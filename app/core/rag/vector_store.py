@@ -0,0 +1,480 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Type
+
+import numpy as np
+from dotenv import load_dotenv
+from loguru import logger
+from qdrant_client.models import PointStruct
+
+from ...schemas.retrieval import RetrievalOptions
+from . import qdrant_db
+
+load_dotenv()
+
+# 向量存储后端，可选值见VECTOR_STORES
+VECTOR_STORE = os.getenv("VECTOR_STORE", "qdrant")
+# 进程内存储的数据目录与向量精度（float32或float16）
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", ".cache/vector_store")
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")
+
+VECTOR_STORES: Dict[str, Type["VectorStore"]] = {}
+
+# 生成确定性点ID的命名空间
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "knowledge-base-assistant/chunk")
+
+
+def make_point_id(user_id: int, file_id: int, chunk_index: int, content: str) -> str:
+    """
+    由用户、文件、块序号和内容哈希生成确定性的点ID
+    重新上传相同内容时ID不变，写入会覆盖原有的点而不是追加新点
+    """
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return str(
+        uuid.uuid5(
+            POINT_ID_NAMESPACE, f"{user_id}:{file_id}:{chunk_index}:{content_hash}"
+        )
+    )
+
+
+@dataclass
+class VectorRecord:
+    id: str
+    vector: List[float]
+    # 必须包含user_id，导入的块还包含content、file_id等字段
+    payload: dict = field(default_factory=dict)
+
+
+@dataclass
+class SearchHit:
+    id: str
+    score: float
+    payload: dict
+
+
+def register_vector_store(name: str) -> Callable[[Type["VectorStore"]], Type]:
+    """注册向量存储后端，通过VECTOR_STORE按名称选择"""
+
+    def decorator(cls: Type["VectorStore"]):
+        cls.name = name
+        VECTOR_STORES[name] = cls
+        return cls
+
+    return decorator
+
+
+def create_vector_store(name: Optional[str] = None) -> "VectorStore":
+    name = name or VECTOR_STORE
+    if name not in VECTOR_STORES:
+        raise ValueError(
+            f"Unknown vector store {name}, available: {', '.join(VECTOR_STORES)}"
+        )
+    logger.info(f"Loading vector store: {name}")
+    return VECTOR_STORES[name]()
+
+
+_vector_store: Optional["VectorStore"] = None
+
+
+def get_vector_store() -> "VectorStore":
+    """获取全局向量存储实例"""
+    global _vector_store
+    if _vector_store is None:
+        _vector_store = create_vector_store()
+    return _vector_store
+
+
+class VectorStore(ABC):
+    """
+    向量存储接口
+    检索只返回指定用户的数据，写入按点ID覆盖
+    """
+
+    name: str = ""
+    # 流式导入时每次写入的记录数，为None时整个文件的记录攒齐后一次写入
+    write_batch_size: Optional[int] = None
+
+    @property
+    def ready(self) -> bool:
+        return True
+
+    @property
+    def last_error(self) -> Optional[str]:
+        return None
+
+    def start(self):
+        """应用启动时调用，不应阻塞"""
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def upsert(self, records: List[VectorRecord]) -> dict:
+        """写入记录，返回写入统计"""
+
+    @abstractmethod
+    async def delete_stale(
+        self, user_id: int, file_id: int, keep_ids: List[str]
+    ) -> int:
+        """删除文件中不在keep_ids里的旧记录，返回删除数"""
+
+    @abstractmethod
+    async def search(
+        self,
+        query_vector: List[float],
+        user_id: int,
+        query_text: str = "",
+        options: Optional[RetrievalOptions] = None,
+    ) -> List[SearchHit]:
+        """检索用户的块，分层分块的小节点不参与检索"""
+
+    @abstractmethod
+    async def retrieve(self, point_ids: List[str]) -> Dict[str, dict]:
+        """按ID批量读取载荷，不存在的ID不出现在结果中"""
+
+    async def expand_sections(self, hits: List[SearchHit]) -> List[SearchHit]:
+        """
+        将命中的叶子块替换为所在的小节，所有父块通过一次批量读取获得
+        同一小节的多个命中合并为一个，得分取最高的命中，没有父块的命中保持不变
+        """
+        parent_ids = list(
+            dict.fromkeys(
+                hit.payload["parent_id"] for hit in hits if hit.payload.get("parent_id")
+            )
+        )
+        parents = await self.retrieve(parent_ids) if parent_ids else {}
+        expanded, seen = [], set()
+        for hit in hits:
+            parent_id = hit.payload.get("parent_id")
+            if parent_id in parents:
+                if parent_id not in seen:
+                    seen.add(parent_id)
+                    expanded.append(SearchHit(parent_id, hit.score, parents[parent_id]))
+            else:
+                expanded.append(hit)
+        return expanded
+
+
+def _sparse_text(payload: dict) -> str:
+    # 小节点不参与检索，不需要稀疏向量
+    if payload.get("kind") == qdrant_db.SECTION_KIND:
+        return ""
+    return payload.get("content", "")
+
+
+@register_vector_store("qdrant")
+class QdrantVectorStore(VectorStore):
+    """Qdrant服务端存储，支持量化、两阶段检索和混合检索"""
+
+    # 每次写入刚好填满所有并发的upsert请求
+    write_batch_size = (
+        qdrant_db.QDRANT_UPSERT_BATCH_SIZE * qdrant_db.QDRANT_UPSERT_PARALLEL
+    )
+
+    @property
+    def ready(self) -> bool:
+        return qdrant_db.qdrant_client_manager.ready
+
+    @property
+    def last_error(self) -> Optional[str]:
+        return qdrant_db.qdrant_client_manager.last_error
+
+    def start(self):
+        # Qdrant在后台连接，不阻塞启动，连接失败时自动重试
+        qdrant_db.qdrant_client_manager.start()
+
+    async def close(self):
+        await qdrant_db.qdrant_client_manager.close()
+
+    async def upsert(self, records: List[VectorRecord]) -> dict:
+        # 先完成集合初始化，确定集合是否支持混合检索后再生成点向量
+        await qdrant_db.qdrant_client_manager.get_ready_client()
+        points = [
+            PointStruct(
+                id=record.id,
+                vector=qdrant_db.build_point_vector(
+                    record.vector, _sparse_text(record.payload)
+                ),
+                payload=record.payload,
+            )
+            for record in records
+        ]
+        return await qdrant_db.upsert_points_bulk(points)
+
+    async def delete_stale(
+        self, user_id: int, file_id: int, keep_ids: List[str]
+    ) -> int:
+        return await qdrant_db.delete_stale_points(user_id, file_id, keep_ids)
+
+    async def search(
+        self,
+        query_vector: List[float],
+        user_id: int,
+        query_text: str = "",
+        options: Optional[RetrievalOptions] = None,
+    ) -> List[SearchHit]:
+        client = await qdrant_db.qdrant_client_manager.get_ready_client()
+        result = await client.query_points(
+            collection_name=qdrant_db.QDRANT_COLLECTION_NAME,
+            **qdrant_db.build_query_args(
+                query_vector,
+                query_filter=qdrant_db.build_search_filter(user_id),
+                limit=qdrant_db.resolve_option(options, "limit"),
+                query_text=query_text,
+                options=options,
+            ),
+        )
+        return [
+            SearchHit(id=str(point.id), score=point.score, payload=point.payload)
+            for point in result.points
+        ]
+
+    async def retrieve(self, point_ids: List[str]) -> Dict[str, dict]:
+        client = await qdrant_db.qdrant_client_manager.get_ready_client()
+        records = await client.retrieve(
+            collection_name=qdrant_db.QDRANT_COLLECTION_NAME,
+            ids=point_ids,
+            with_payload=True,
+            with_vectors=False,
+        )
+        return {str(record.id): record.payload for record in records}
+
+
+@dataclass(frozen=True)
+class _NumpyState:
+    """进程内存储的一个快照，写入时整体替换，检索线程不会读到新旧混合的数据"""
+
+    vectors: np.ndarray
+    ids: List[str]
+    payloads: List[dict]
+    # user_id到其连续行区间的映射
+    offsets: Dict[int, tuple]
+    # 可参与检索的行（排除小节点）和ID到行号的映射
+    searchable: np.ndarray
+    positions: Dict[str, int]
+
+
+@register_vector_store("numpy")
+class NumpyVectorStore(VectorStore):
+    """
+    进程内向量存储，适合开发环境、CI和小租户
+    向量归一化后存放在按user_id排序的内存映射矩阵中，每个用户对应一段连续的行，
+    检索时只对该用户的行做矩阵乘法，再用argpartition取top-k，没有网络开销
+    写入会重写整个矩阵文件，适用于十万个块以内的规模
+    """
+
+    def __init__(self, path: str = VECTOR_STORE_PATH, dtype: str = VECTOR_STORE_DTYPE):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported VECTOR_STORE_DTYPE: {dtype}")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._vectors_path = os.path.join(path, "vectors.npy")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock = threading.Lock()
+        self._state = _NumpyState(
+            vectors=np.zeros((0, 0), dtype=self.dtype),
+            ids=[],
+            payloads=[],
+            offsets={},
+            searchable=np.zeros(0, dtype=bool),
+            positions={},
+        )
+        self._load()
+
+    def _set_state(self, vectors, ids: List[str], payloads: List[dict], offsets):
+        # 一次赋值发布新快照
+        self._state = _NumpyState(
+            vectors=vectors,
+            ids=ids,
+            payloads=payloads,
+            offsets=offsets,
+            searchable=np.array(
+                [payload.get("kind") != qdrant_db.SECTION_KIND for payload in payloads],
+                dtype=bool,
+            ),
+            positions={point_id: i for i, point_id in enumerate(ids)},
+        )
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(self._vectors_path, mmap_mode="r")
+        if len(vectors) != len(meta["ids"]):
+            # 写入中断导致矩阵和元数据不一致，需要重新导入
+            logger.error(f"Vector store at {self.path} is inconsistent, ignoring it")
+            return
+        self._set_state(
+            vectors,
+            meta["ids"],
+            meta["payloads"],
+            {int(k): tuple(v) for k, v in meta["offsets"].items()},
+        )
+        logger.info(f"Loaded {len(self._state.ids)} vectors from {self.path}")
+
+    def _rewrite(self, ids: List[str], payloads: List[dict], vectors: np.ndarray):
+        """按user_id排序后写入新文件，替换完成前读者仍使用旧的矩阵"""
+        users = np.array([payload["user_id"] for payload in payloads], dtype=np.int64)
+        order = np.argsort(users, kind="stable")
+        ids = [ids[i] for i in order]
+        payloads = [payloads[i] for i in order]
+        vectors = vectors[order].astype(self.dtype)
+        unique, starts, counts = np.unique(
+            users[order], return_index=True, return_counts=True
+        )
+        offsets = {
+            int(user): (int(start), int(start + count))
+            for user, start, count in zip(unique, starts, counts)
+        }
+
+        os.makedirs(self.path, exist_ok=True)
+        np.save(self._vectors_path + ".tmp.npy", vectors)
+        os.replace(self._vectors_path + ".tmp.npy", self._vectors_path)
+        with open(self._meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {"ids": ids, "payloads": payloads, "offsets": offsets},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(self._meta_path + ".tmp", self._meta_path)
+
+        self._set_state(
+            np.load(self._vectors_path, mmap_mode="r"), ids, payloads, offsets
+        )
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _upsert(self, records: List[VectorRecord]) -> dict:
+        start = time.perf_counter()
+        with self._lock:
+            state = self._state
+            ids = list(state.ids)
+            payloads = list(state.payloads)
+            new = self._normalize([record.vector for record in records])
+            if len(state.ids) and new.shape[1] != state.vectors.shape[1]:
+                raise ValueError(
+                    f"Vector dimension {new.shape[1]} does not match "
+                    f"store dimension {state.vectors.shape[1]}"
+                )
+            # 复制一份可写的矩阵，内存映射的旧矩阵在替换前仍供检索使用
+            vectors = (
+                np.array(state.vectors, dtype=np.float32)
+                if len(state.ids)
+                else np.zeros((0, new.shape[1]), dtype=np.float32)
+            )
+            positions = {point_id: i for i, point_id in enumerate(ids)}
+            appended = []
+            for record, vector in zip(records, new):
+                if record.id in positions:
+                    vectors[positions[record.id]] = vector
+                    payloads[positions[record.id]] = record.payload
+                else:
+                    positions[record.id] = len(ids)
+                    ids.append(record.id)
+                    payloads.append(record.payload)
+                    appended.append(vector)
+            if appended:
+                vectors = np.vstack([vectors, np.stack(appended)])
+            self._rewrite(ids, payloads, vectors)
+        elapsed = time.perf_counter() - start
+        return {
+            "points": len(records),
+            "batches": 1,
+            "seconds": elapsed,
+            "points_per_second": len(records) / elapsed if elapsed else 0.0,
+        }
+
+    def _delete_stale(self, user_id: int, file_id: int, keep_ids: List[str]) -> int:
+        keep_ids = set(keep_ids)
+        with self._lock:
+            state = self._state
+            keep = [
+                i
+                for i, (point_id, payload) in enumerate(zip(state.ids, state.payloads))
+                if point_id in keep_ids
+                or payload.get("user_id") != user_id
+                or payload.get("file_id") != file_id
+            ]
+            removed = len(state.ids) - len(keep)
+            if removed:
+                self._rewrite(
+                    [state.ids[i] for i in keep],
+                    [state.payloads[i] for i in keep],
+                    np.asarray(state.vectors[keep], dtype=np.float32),
+                )
+        return removed
+
+    def search_sync(
+        self,
+        query_vector: List[float],
+        user_id: int,
+        limit: int,
+        score_threshold: Optional[float] = None,
+    ) -> List[SearchHit]:
+        # 取当前快照，写入替换矩阵不影响进行中的检索
+        state = self._state
+        vectors, ids, payloads = state.vectors, state.ids, state.payloads
+        start, end = state.offsets.get(user_id, (0, 0))
+        searchable = state.searchable[start:end]
+        k = min(limit, int(searchable.sum()))
+        if k == 0:
+            return []
+        rows = vectors[start:end]
+        query = self._normalize(query_vector).astype(rows.dtype)
+        scores = (rows @ query).astype(np.float32)
+        scores[~searchable] = -np.inf
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            SearchHit(
+                id=ids[start + i], score=float(scores[i]), payload=payloads[start + i]
+            )
+            for i in top
+            if score_threshold is None or scores[i] >= score_threshold
+        ]
+
+    async def upsert(self, records: List[VectorRecord]) -> dict:
+        if not records:
+            return {"points": 0, "batches": 0, "seconds": 0.0, "points_per_second": 0.0}
+        return await asyncio.to_thread(self._upsert, records)
+
+    async def delete_stale(
+        self, user_id: int, file_id: int, keep_ids: List[str]
+    ) -> int:
+        return await asyncio.to_thread(self._delete_stale, user_id, file_id, keep_ids)
+
+    async def search(
+        self,
+        query_vector: List[float],
+        user_id: int,
+        query_text: str = "",
+        options: Optional[RetrievalOptions] = None,
+    ) -> List[SearchHit]:
+        # 始终是精确检索，hnsw_ef、量化和混合检索参数不适用
+        return self.search_sync(
+            query_vector,
+            user_id,
+            limit=qdrant_db.resolve_option(options, "limit"),
+            score_threshold=qdrant_db.resolve_option(options, "score_threshold"),
+        )
+
+    async def retrieve(self, point_ids: List[str]) -> Dict[str, dict]:
+        state = self._state
+        payloads, positions = state.payloads, state.positions
+        return {
+            point_id: payloads[positions[point_id]]
+            for point_id in point_ids
+            if point_id in positions
+        }
@@ -0,0 +1,307 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from dotenv import load_dotenv
+from loguru import logger
+from openai import APIConnectionError
+
+load_dotenv()
+
+# 嵌入接口调用预算，0表示不限制
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "0"))
+EMBEDDING_TOKENS_PER_MINUTE = float(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "0"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+EMBEDDING_TARGET_LATENCY = float(os.getenv("EMBEDDING_TARGET_LATENCY", "5"))
+# 对话接口调用预算，0表示不限制
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TARGET_LATENCY = float(os.getenv("LLM_TARGET_LATENCY", "30"))
+# 重试与熔断配置
+MODEL_CALL_MAX_RETRIES = int(os.getenv("MODEL_CALL_MAX_RETRIES", "5"))
+MODEL_CALL_BACKOFF_BASE = float(os.getenv("MODEL_CALL_BACKOFF_BASE", "0.5"))
+MODEL_CALL_BACKOFF_MAX = float(os.getenv("MODEL_CALL_BACKOFF_MAX", "30"))
+MODEL_CALL_BREAKER_THRESHOLD = int(os.getenv("MODEL_CALL_BREAKER_THRESHOLD", "5"))
+MODEL_CALL_BREAKER_RESET = float(os.getenv("MODEL_CALL_BREAKER_RESET", "30"))
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间拒绝调用"""
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    return getattr(exc, "status_code", None)
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    return _status_code(exc) == 429
+
+
+def is_retryable(exc: Exception) -> bool:
+    """限流、超时、连接错误和服务端错误可以重试，其余客户端错误直接抛出"""
+    return (
+        isinstance(exc, (APIConnectionError, TimeoutError))
+        or _status_code(exc) in RETRYABLE_STATUS_CODES
+    )
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """读取服务端返回的Retry-After秒数"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """令牌桶，按每分钟速率匀速补充，容量为一分钟的额度"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        if not self.enabled or amount <= 0:
+            return
+        # 超过桶容量的请求按满桶处理，避免永远等不到
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD并发控制
+    调用成功且延迟低于目标时并发上限加性增长，遇到限流或延迟超标时乘性减半
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        target_latency: float,
+        min_limit: int = 1,
+        decrease_factor: float = 0.5,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            try:
+                await future
+            finally:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        available = int(self.limit) - self.in_flight
+        while available > 0 and self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                available -= 1
+
+    def on_success(self, latency: float):
+        if latency > self.target_latency:
+            self._decrease()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_overload(self):
+        self._decrease()
+
+    def _decrease(self):
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后熔断，冷却结束后放行调用试探，再次失败立即重新熔断
+    只统计服务端错误和连接错误，限流由退避和并发控制处理，不计入失败
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def remaining(self) -> float:
+        """距离进入半开状态的秒数，未熔断时为0"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self):
+        if self.state == "open":
+            raise CircuitOpenError("Circuit breaker is open, upstream is unavailable")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class ModelCallScheduler:
+    """
+    模型接口调用调度器
+    按请求数和token数的每分钟预算限速，用AIMD调整并发，
+    对可重试错误做带抖动的指数退避，持续失败时熔断
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_concurrency: int = 4,
+        target_latency: float = 5,
+        max_retries: int = MODEL_CALL_MAX_RETRIES,
+        backoff_base: float = MODEL_CALL_BACKOFF_BASE,
+        backoff_max: float = MODEL_CALL_BACKOFF_MAX,
+        breaker_threshold: int = MODEL_CALL_BREAKER_THRESHOLD,
+        breaker_reset: float = MODEL_CALL_BREAKER_RESET,
+    ):
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency, target_latency)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            # 服务端给出的等待时间同样不超过backoff_max，避免异常值让请求长时间挂起
+            return min(max(retry_after, 0.0), self.backoff_max)
+        # full jitter，避免大量请求在同一时刻重试
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def run(self, call: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+        """
+        在预算和并发限制内执行一次调用，失败时按策略重试
+        熔断期间新的调用直接失败，已在重试的调用等到半开后继续
+        """
+        attempt = 0
+        while True:
+            if attempt == 0:
+                self.breaker.before_call()
+            while (wait := self.breaker.remaining()) > 0:
+                await asyncio.sleep(wait)
+            await self.requests.acquire(1)
+            await self.tokens.acquire(tokens)
+            await self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                result = await call()
+            except Exception as exc:
+                if not is_retryable(exc):
+                    raise
+                if is_rate_limited(exc):
+                    self.rate_limited += 1
+                    self.limiter.on_overload()
+                else:
+                    self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    logger.error(f"{self.name} call failed after {attempt} retries")
+                    raise
+                delay = self._backoff(attempt, exc)
+                logger.warning(
+                    f"{self.name} call failed ({exc}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+                )
+            else:
+                self.limiter.on_success(time.monotonic() - start)
+                self.breaker.record_success()
+                return result
+            finally:
+                self.limiter.release()
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": self.limiter.limit,
+            "in_flight": self.limiter.in_flight,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "breaker": self.breaker.state,
+        }
+
+
+embedding_scheduler = ModelCallScheduler(
+    "embedding",
+    requests_per_minute=EMBEDDING_REQUESTS_PER_MINUTE,
+    tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+    max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+    target_latency=EMBEDDING_TARGET_LATENCY,
+)
+llm_scheduler = ModelCallScheduler(
+    "llm",
+    requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    target_latency=LLM_TARGET_LATENCY,
+)
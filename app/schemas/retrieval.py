@@ -0,0 +1,31 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class RetrievalOptions(BaseModel):
+    """单次检索的参数，未设置的字段使用服务端默认配置"""
+
+    limit: Optional[int] = Field(default=None, ge=1, le=50)
+    hnsw_ef: Optional[int] = Field(default=None, ge=1)
+    exact: Optional[bool] = None
+    rescore: Optional[bool] = None
+    oversampling: Optional[float] = Field(default=None, ge=1)
+    score_threshold: Optional[float] = None
+    # 是否将命中的叶子块扩展为所在小节
+    expand_sections: Optional[bool] = None
+
+
+class RetrievalBenchmarkRequest(BaseModel):
+    queries: List[str] = Field(min_length=1)
+    # 为空时检索所有用户的数据
+    user_id: Optional[int] = None
+    # 为空时使用默认的hnsw_ef扫描组合
+    options: List[RetrievalOptions] = []
+
+
+class RetrievalBenchmarkResult(BaseModel):
+    options: RetrievalOptions
+    p50_ms: float
+    p95_ms: float
+    recall: float
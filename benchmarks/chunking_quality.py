@@ -0,0 +1,93 @@
+"""
+比较改动前的按字符分块与按嵌入模型token分块（带重叠）的分块数量、向量密度和检索命中率
+
+命中率为问题的Top-K检索结果中包含标准答案原文的比例。嵌入使用当前配置的后端，
+设置EMBEDDING_BACKEND=hashing可在无网络环境下运行。未指定文档时使用内置样例。
+
+    python -m benchmarks.chunking_quality --document docs/handbook.md --queries qa.jsonl --top-k 3
+
+qa.jsonl每行一个{"query": "...", "answer": "..."}，answer需为文档中的原文片段。
+"""
+
+import argparse
+import json
+from typing import List, Tuple
+
+import numpy as np
+
+from app.core.rag.chunking import DocumentChunker
+from app.core.rag.embedding_backends import create_backend
+
+# 内置样例：每节包含一条只在该节出现的事实
+SAMPLE_FACTS = [
+    ("年假", "入职满一年的员工每年享有十天带薪年假"),
+    ("病假", "病假超过三天需要提交医院开具的诊断证明"),
+    ("出差", "出差住宿标准为一线城市每晚不超过六百元"),
+    ("报销", "单笔超过五千元的报销需部门负责人二次审批"),
+    ("加班", "工作日加班可按一比一的比例申请调休"),
+    ("设备", "离职时需在最后工作日前归还笔记本电脑和门禁卡"),
+    ("培训", "新员工需在试用期内完成信息安全培训并通过考试"),
+    ("采购", "金额超过两万元的采购需要至少三家供应商比价"),
+]
+FILLER = "本制度由人力资源部负责解释，各部门应当认真组织学习并严格执行相关要求。"
+
+
+def sample_corpus() -> Tuple[str, List[dict]]:
+    sections = []
+    for i, (topic, fact) in enumerate(SAMPLE_FACTS):
+        paragraphs = [FILLER * 3, f"关于{topic}：{fact}。", FILLER * 4]
+        sections.append(f"## 第{i + 1}节 {topic}管理\n\n" + "\n\n".join(paragraphs))
+    queries = [
+        {"query": f"公司对{topic}有什么规定？", "answer": fact}
+        for topic, fact in SAMPLE_FACTS
+    ]
+    return "\n\n".join(sections), queries
+
+
+def hit_rate(chunks: List[str], queries: List[dict], top_k: int, backend) -> float:
+    chunk_vectors = np.asarray(backend.embed_texts(chunks), dtype=np.float32)
+    query_vectors = np.asarray(
+        backend.embed_texts([item["query"] for item in queries]), dtype=np.float32
+    )
+    scores = query_vectors @ chunk_vectors.T
+    hits = 0
+    for item, row in zip(queries, scores):
+        top = np.argsort(-row)[:top_k]
+        hits += any(item["answer"] in chunks[i] for i in top)
+    return hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--document", help="Markdown文档路径")
+    parser.add_argument("--queries", help="问题与答案的jsonl路径")
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.document:
+        with open(args.document, encoding="utf-8") as f:
+            document = f.read()
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [json.loads(line) for line in f if line.strip()]
+    else:
+        document, queries = sample_corpus()
+
+    backend = create_backend()
+    megabytes = len(document.encode("utf-8")) / (1024 * 1024)
+    settings = [
+        ("old: 500 chars, no overlap", DocumentChunker(500, 0, "character")),
+        ("new: token defaults", DocumentChunker()),
+    ]
+    print(
+        f"{'settings':<30} {'chunks':>7} {'vectors/MB':>11} {'hit@' + str(args.top_k):>7}"
+    )
+    for name, chunker in settings:
+        chunks = chunker.chunk_word(document)
+        rate = hit_rate(chunks, queries, args.top_k, backend)
+        print(
+            f"{name:<30} {len(chunks):>7} {len(chunks) / megabytes:>11.0f} {rate:>7.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
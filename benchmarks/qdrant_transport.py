@@ -0,0 +1,131 @@
+"""
+比较Qdrant的REST和gRPC传输在本项目写入与检索负载下的性能
+
+在临时集合中按导入时的形态批量写入带全文载荷的点，再按检索时的形态发起带用户过滤的查询，
+分别统计两种传输的写入吞吐和查询延迟。需要可访问的Qdrant服务，连接参数与应用相同。
+
+    python -m benchmarks.qdrant_transport --points 5000 --queries 200
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PointStruct,
+    VectorParams,
+)
+
+from app.core.rag.qdrant_db import (
+    QDRANT_COLLECTION_NAME,
+    VECTOR_SIZE,
+    build_client_args,
+)
+
+# 模拟分块后的正文长度
+CHUNK_TEXT = "员工年假申请需提前三个工作日提交审批，SKU-1024库存以系统为准。" * 16
+
+
+def make_points(count: int, dim: int, users: int):
+    return [
+        PointStruct(
+            id=i,
+            vector=[random.gauss(0, 1) for _ in range(dim)],
+            payload={
+                "content": CHUNK_TEXT,
+                "source": f"bench/{i // 100}.docx",
+                "user_id": i % users,
+                "file_type": "docx",
+                "chunk_index": i % 100,
+            },
+        )
+        for i in range(count)
+    ]
+
+
+def percentile(values, q: float) -> float:
+    return statistics.quantiles(values, n=100)[int(q) - 1] if len(values) > 1 else 0
+
+
+async def bench_transport(prefer_grpc: bool, points, queries, args) -> dict:
+    client = AsyncQdrantClient(**build_client_args(prefer_grpc))
+    collection = f"{QDRANT_COLLECTION_NAME}_transport_bench"
+    try:
+        if await client.collection_exists(collection):
+            await client.delete_collection(collection)
+        await client.create_collection(
+            collection_name=collection,
+            vectors_config=VectorParams(size=args.dim, distance=Distance.COSINE),
+        )
+
+        start = time.perf_counter()
+        for i in range(0, len(points), args.batch_size):
+            await client.upsert(
+                collection_name=collection,
+                points=points[i : i + args.batch_size],
+                wait=True,
+            )
+        upsert_seconds = time.perf_counter() - start
+
+        latencies = []
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            await client.query_points(
+                collection_name=collection,
+                query=query,
+                query_filter=Filter(
+                    must=[
+                        FieldCondition(
+                            key="user_id", match=MatchValue(value=i % args.users)
+                        )
+                    ]
+                ),
+                limit=args.limit,
+                with_payload=True,
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        await client.delete_collection(collection)
+        await client.close()
+
+    return {
+        "transport": "grpc" if prefer_grpc else "rest",
+        "upsert_points_per_second": len(points) / upsert_seconds,
+        "query_p50_ms": statistics.median(latencies),
+        "query_p95_ms": percentile(latencies, 95),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=VECTOR_SIZE)
+    args = parser.parse_args()
+
+    points = make_points(args.points, args.dim, args.users)
+    queries = [
+        [random.gauss(0, 1) for _ in range(args.dim)] for _ in range(args.queries)
+    ]
+    for prefer_grpc in (False, True):
+        result = await bench_transport(prefer_grpc, points, queries, args)
+        print(
+            f"{result['transport']:>5}: "
+            f"upsert {result['upsert_points_per_second']:.0f} points/s, "
+            f"query p50 {result['query_p50_ms']:.1f}ms "
+            f"p95 {result['query_p95_ms']:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
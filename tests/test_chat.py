@@ -45,4 +45,19 @@ async def test_chat_completion():
             info = response.json()
             assert "answer" in info
             assert "session_id" in info
-            assert info["session_id"] == "test_session_123"
\ No newline at end of file
+            assert info["session_id"] == "test_session_123"
+
+@pytest.mark.asyncio
+async def test_cache_stats_requires_permission():
+    async with AsyncClient(app=app, base_url=base_url) as client:
+        response = await client.get("/chat/cache/stats")
+        assert response.status_code == 401
+
+        # admin角色拥有retrieval:manage权限
+        access_token = await fetch_access_token()
+        response = await client.get(
+            "/chat/cache/stats",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert response.status_code == 200
+        assert "embedding_scheduler" in response.json()
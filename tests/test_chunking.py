@@ -0,0 +1,86 @@
+from app.core.rag.chunking import (
+    DocumentChunker,
+    SectionChunker,
+    get_chunk_counter,
+    get_document_chunker,
+    get_recursive_chunker,
+    split_table,
+)
+
+
+def test_chunkers_are_cached_per_configuration():
+    assert get_document_chunker() is get_document_chunker()
+    assert get_recursive_chunker(500) is get_recursive_chunker(500)
+    assert get_recursive_chunker(500) is not get_recursive_chunker(200)
+
+
+def test_chunk_word_and_excel():
+    chunker = DocumentChunker(chunk_size=128, chunk_overlap=0)
+    markdown = "\n\n".join(
+        f"## 第{i}节\n\n" + "报销需提交审批。" * 20 for i in range(5)
+    )
+    chunks = chunker.chunk_word(markdown)
+    assert len(chunks) > 1
+    assert "".join(chunks) == markdown
+
+    table = "| 编号 | 库存 |\n| --- | --- |\n" + "| SKU-1 | 3 |\n" * 100
+    chunks = chunker.chunk_excel(table)
+    assert len(chunks) > 1
+    assert all(chunk.startswith("| 编号 | 库存 |") for chunk in chunks)
+
+
+def test_chunk_word_respects_token_budget_and_overlap():
+    chunker = DocumentChunker(chunk_size=64, chunk_overlap=16)
+    count_tokens = get_chunk_counter()
+    markdown = "\n\n".join(
+        f"## 第{i}节\n\n" + "".join(f"第{j}条规定需要审批。" for j in range(10))
+        for i in range(5)
+    )
+    chunks = chunker.chunk_word(markdown)
+    assert len(chunks) > 2
+    assert all(count_tokens(chunk) <= 64 for chunk in chunks)
+    # 每个块以前一块的末尾开头
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert any(previous.endswith(chunk[:n]) for n in range(2, len(chunk)))
+
+
+def test_chunk_excel_repeats_rows_as_overlap():
+    chunker = DocumentChunker(chunk_size=200, chunk_overlap=30, tokenizer="character")
+    header = "| 编号 | 库存 |\n| --- | --- |\n"
+    table = header + "".join(f"| SKU-{i} | {i} |\n" for i in range(50))
+    chunks = chunker.chunk_excel(table)
+    assert len(chunks) > 1
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.startswith(header)
+        first_row = chunk[len(header) :].split("\n")[0]
+        assert first_row in previous
+
+
+def test_chunk_excel_counts_tokens_with_configured_tokenizer():
+    chunker = DocumentChunker(chunk_size=64, chunk_overlap=0)
+    count_tokens = get_chunk_counter()
+    header = "| 编号 | 名称 | 库存 |\n| --- | --- | --- |\n"
+    rows = [f"| SKU-{i} | 办公椅{i}号 | {i} |\n" for i in range(40)]
+    chunks = chunker.chunk_excel(header + "".join(rows))
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 64 for chunk in chunks)
+    # 按整行切分，每行只出现在一个块中
+    assert [row for chunk in chunks for row in split_table(chunk)[1]] == rows
+
+
+def test_section_chunker_records_heading_path():
+    chunker = SectionChunker(
+        DocumentChunker(chunk_size=40, chunk_overlap=0), max_section_tokens=400
+    )
+    body = "".join(f"第{j}条规定需要审批。" for j in range(10))
+    leaves = chunker(f"# 人事制度\n\n## 年假\n\n{body}\n")
+    # 片段在标题处切分，下一个片段延续上一片段的标题层级
+    leaves += chunker("## 病假\n\n病假需提交证明。\n")
+
+    annual = [leaf for leaf in leaves if leaf.section_path == ("人事制度", "年假")]
+    assert len(annual) > 1
+    assert annual[0].section is annual[-1].section
+    assert annual[0].section.text.startswith("## 年假")
+    sick = [leaf for leaf in leaves if leaf.section_path == ("人事制度", "病假")]
+    # 只有一个叶子块的小节不需要父块
+    assert len(sick) == 1 and sick[0].section is None
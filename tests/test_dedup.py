@@ -0,0 +1,66 @@
+from app.core.rag.chunking import DocumentChunker
+from app.core.rag.dedup import (
+    PendingSignatures,
+    SignatureIndex,
+    hamming_distance,
+    simhash,
+)
+
+DISCLAIMER = "本文件仅供内部使用，未经许可不得外传，如有疑问请联系法务部。"
+POLICY = "员工出差产生的交通、住宿费用需在返回后五个工作日内提交报销申请。"
+
+
+def test_simhash_is_close_for_near_duplicates():
+    assert simhash(POLICY) == simhash(POLICY)
+    assert hamming_distance(simhash(POLICY), simhash(POLICY + "！")) <= 3
+    assert hamming_distance(simhash(POLICY), simhash(DISCLAIMER)) > 10
+
+
+def mark(index, user_id, file_id, texts):
+    """判断重复并在成功导入后登记签名，返回重复标记"""
+    pending = PendingSignatures()
+    duplicates = index.mark_duplicates(user_id, file_id, texts, pending)
+    index.replace_file(user_id, file_id, pending.signatures)
+    return duplicates
+
+
+def test_signature_index_is_scoped_per_user(tmp_path):
+    index = SignatureIndex(str(tmp_path / "dedup.sqlite3"))
+    assert mark(index, 1, 1, [DISCLAIMER, POLICY, DISCLAIMER]) == [False, False, True]
+    assert mark(index, 1, 2, [DISCLAIMER + "！"]) == [True]
+    assert mark(index, 2, 3, [DISCLAIMER]) == [False]
+    # 重新导入同一文件时不与自身旧版本比较
+    assert mark(index, 1, 1, [POLICY]) == [False]
+
+    index.replace_file(1, 1, [])
+    assert mark(index, 1, 4, [DISCLAIMER]) == [False]
+
+
+def test_unregistered_signatures_do_not_mark_duplicates(tmp_path):
+    index = SignatureIndex(str(tmp_path / "dedup.sqlite3"))
+    # 导入失败时pending被丢弃，之后导入相同内容不会被跳过
+    index.mark_duplicates(1, 1, [POLICY], PendingSignatures())
+    assert mark(index, 1, 2, [POLICY]) == [False]
+
+
+def test_featureless_chunks_are_not_duplicates(tmp_path):
+    index = SignatureIndex(str(tmp_path / "dedup.sqlite3"))
+    assert mark(index, 1, 1, ["。", "——", "！"]) == [False, False, False]
+    assert mark(index, 1, 2, ["。"]) == [False]
+
+
+def test_table_chunks_with_different_rows_are_kept(tmp_path):
+    index = SignatureIndex(str(tmp_path / "dedup.sqlite3"))
+    departments = ["销售部", "研发部", "财务部"]
+    rows = [
+        f"| {1000 + i} | 员工{i} | {departments[i % 3]} | 在职 | 2021-0{i % 9 + 1}-1{i % 10} |"
+        for i in range(230)
+    ]
+    table = (
+        "| 工号 | 姓名 | 部门 | 状态 | 入职日期 |\n| --- | --- | --- | --- | --- |\n"
+        + "\n".join(rows)
+        + "\n"
+    )
+    chunks = DocumentChunker(1024, 0, "character").chunk_excel(table)
+    assert len(chunks) > 5
+    assert mark(index, 1, 1, chunks) == [False] * len(chunks)
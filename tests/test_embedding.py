@@ -0,0 +1,82 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.core.rag.embedding import EmbeddingMicroBatcher, pack_batches
+from app.core.rag.embedding_backends import HashingEmbeddingBackend, create_backend
+from app.core.rag.tokenizer import estimate_tokens
+
+
+def test_pack_batches_respects_budgets():
+    texts = ["a" * n for n in (20, 60, 30, 50, 40)]
+    batches = pack_batches(texts, max_tokens=100, max_items=3, count_tokens=len)
+    assert all(batch.tokens <= 100 for batch in batches)
+    assert all(len(batch.texts) <= 3 for batch in batches)
+    assert sum(batch.tokens for batch in batches) == 200
+    # first-fit decreasing：200个token恰好装满两个请求
+    assert len(batches) == 2
+    for batch in batches:
+        assert [texts[i] for i in batch.indices] == batch.texts
+
+
+def test_pack_batches_oversized_text_gets_own_batch():
+    texts = ["a" * 500, "b" * 10]
+    batches = pack_batches(texts, max_tokens=100, max_items=10, count_tokens=len)
+    assert [batch.indices for batch in batches] == [[0], [1]]
+
+
+def test_pack_batches_empty():
+    assert pack_batches([], max_tokens=100, max_items=3, count_tokens=len) == []
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("年假申请") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+async def test_micro_batcher_coalesces_concurrent_requests():
+    calls = []
+
+    async def embed_batch(texts):
+        calls.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    batcher = EmbeddingMicroBatcher(embed_batch, max_wait_ms=20, max_batch_size=8)
+    texts = [f"q{'x' * i}" for i in range(10)]
+    vectors = await asyncio.gather(*(batcher.submit(text) for text in texts))
+    assert vectors == [[float(len(text))] for text in texts]
+    assert [len(batch) for batch in calls] == [8, 2]
+
+
+async def test_micro_batcher_propagates_errors():
+    async def embed_batch(texts):
+        raise RuntimeError("upstream failed")
+
+    batcher = EmbeddingMicroBatcher(embed_batch, max_wait_ms=1, max_batch_size=4)
+    with pytest.raises(RuntimeError):
+        await batcher.submit("hello")
+
+
+def test_hashing_backend_is_deterministic_and_normalized():
+    backend = create_backend("hashing")
+    vectors = backend.embed_texts(["报销流程 SKU-1024", "报销流程 SKU-1024", ""])
+    assert len(vectors[0]) == backend.dim
+    assert vectors[0] == vectors[1]
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not any(vectors[2])
+
+
+def test_hashing_backend_similarity():
+    backend = HashingEmbeddingBackend(dim=256)
+    query, close, far = np.array(
+        backend.embed_texts(
+            ["年假申请流程", "员工年假申请的流程说明", "服务器机房温度"]
+        )
+    )
+    assert query @ close > query @ far
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_backend("missing")
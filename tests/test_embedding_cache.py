@@ -0,0 +1,80 @@
+import pytest
+
+from app.core.rag.embedding_cache import (
+    EmbeddingCache,
+    QueryEmbeddingCache,
+    make_cache_key,
+    normalize_query,
+)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_cache_key_depends_on_model_and_dim():
+    key = make_cache_key("model-a", 1024, "hello")
+    assert key == make_cache_key("model-a", 1024, "hello")
+    assert key != make_cache_key("model-b", 1024, "hello")
+    assert key != make_cache_key("model-a", 512, "hello")
+
+
+def test_put_and_get(cache):
+    cache.put_many({"a": [0.5, 1.0], "b": [2.0, -1.0]})
+    assert cache.get_many(["a", "b", "c"]) == {"a": [0.5, 1.0], "b": [2.0, -1.0]}
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_lru_eviction(cache):
+    for key, value in [("a", 1.0), ("b", 2.0), ("c", 3.0)]:
+        cache.put_many({key: [value]})
+    # 访问a，使b成为最久未访问的条目
+    cache.get_many(["a"])
+    cache.put_many({"d": [4.0]})
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+    assert cache.stats()["entries"] == 3
+
+
+def test_entry_count_tracks_inserts_and_evictions(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path, max_entries=3)
+    cache.put_many({"a": [1.0], "b": [2.0]})
+    # 重复写入已有条目不增加条目数
+    cache.put_many({"a": [1.0], "c": [3.0]})
+    assert cache.stats()["entries"] == 3
+    cache.put_many({"d": [4.0], "e": [5.0]})
+    assert cache.stats()["entries"] == 3
+    cache.close()
+
+    reopened = EmbeddingCache(path, max_entries=3)
+    assert reopened.stats()["entries"] == 3
+    assert len(reopened.get_many(["a", "b", "c", "d", "e"])) == 3
+    reopened.close()
+
+
+def test_normalize_query():
+    assert normalize_query("  什么是 \t RAG？ ") == "什么是 RAG?"
+
+
+def test_query_cache_lru_and_stats():
+    cache = QueryEmbeddingCache(capacity=2, ttl=60)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    assert cache.get("a") == [1.0]
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("c") == [3.0]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+
+def test_query_cache_ttl():
+    cache = QueryEmbeddingCache(capacity=2, ttl=-1)
+    cache.put("a", [1.0])
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
@@ -2,6 +2,8 @@ import pytest
 from httpx import AsyncClient
 import io
 
+import pandas as pd
+
 from app.main import app
 
 base_url = "http://localhost:8000"
@@ -39,6 +41,34 @@ async def test_upload_file():
         assert response.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_upload_excel_returns_ingest_stats():
+    access_token = await fetch_access_token()
+    buffer = io.BytesIO()
+    pd.DataFrame(
+        {"编号": [f"SKU-{i}" for i in range(20)], "库存": list(range(20))}
+    ).to_excel(buffer, index=False)
+    async with AsyncClient(app=app, base_url=base_url) as client:
+        files = {
+            "file": (
+                "inventory.xlsx",
+                buffer.getvalue(),
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+        }
+
+        response = await client.post(
+            "/files/upload",
+            files=files,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert response.status_code == 200
+        result = response.json()
+        assert set(result) == {"file_id", "chunks", "duplicates", "dedup_ratio"}
+        assert result["chunks"] > 0
+        assert 0 <= result["dedup_ratio"] <= 1
+
+
 @pytest.mark.asyncio
 async def test_get_file_info():
     access_token = await fetch_access_token()
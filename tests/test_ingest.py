@@ -0,0 +1,157 @@
+import numpy as np
+import pytest
+
+from app.core.rag import ingest
+from app.core.rag.chunking import LeafChunk, Section
+from app.core.rag.dedup import SignatureIndex
+from app.core.rag.embedding import EmbeddingModel
+from app.core.rag.embedding_backends import HashingEmbeddingBackend
+from app.core.rag.vector_store import NumpyVectorStore
+
+
+@pytest.fixture
+def numpy_store(tmp_path, monkeypatch):
+    store = NumpyVectorStore(path=str(tmp_path))
+    index = SignatureIndex(str(tmp_path / "dedup.sqlite3"))
+    monkeypatch.setattr(ingest, "get_vector_store", lambda: store)
+    monkeypatch.setattr(ingest, "get_signature_index", lambda: index)
+    monkeypatch.setattr(EmbeddingModel, "_backend", HashingEmbeddingBackend(dim=64))
+    monkeypatch.setattr(EmbeddingModel, "_cache", None)
+    monkeypatch.setattr("app.core.rag.embedding.get_embedding_cache", lambda: None)
+    return store
+
+
+def split_lines(segment):
+    return [line for line in segment.split("\n") if line]
+
+
+async def test_pipeline_writes_while_parsing(numpy_store, monkeypatch):
+    # 队列容量很小时解析必须等待下游消费，最后一段解析前已有块写入
+    monkeypatch.setattr(ingest, "INGEST_QUEUE_SIZE", 1)
+    numpy_store.write_batch_size = 2
+    written_before_last_segment = []
+
+    async def segments():
+        for i in range(5):
+            if i == 4:
+                written_before_last_segment.append(len(numpy_store._state.ids))
+            yield f"第{i}段第一句\n第{i}段第二句"
+
+    stats = await ingest.ingest_document(
+        segments(), split_lines, "s3://a", 1, 7, "docx"
+    )
+    assert stats["points"] == 10
+    assert written_before_last_segment[0] > 0
+
+    hits = await numpy_store.search(
+        HashingEmbeddingBackend(dim=64).embed_texts(["第3段第二句"])[0], user_id=1
+    )
+    assert hits[0].payload["content"] == "第3段第二句"
+    assert hits[0].payload["chunk_index"] == 7
+
+
+async def test_pipeline_replaces_stale_chunks_and_propagates_errors(numpy_store):
+    async def segments(texts):
+        for text in texts:
+            yield text
+
+    await ingest.ingest_document(
+        segments(["a\nb\nc"]), split_lines, "s3://a", 1, 7, "docx"
+    )
+    stats = await ingest.ingest_document(
+        segments(["a\nd"]), split_lines, "s3://a", 1, 7, "docx"
+    )
+    assert stats["removed"] == 2
+    assert sorted(payload["content"] for payload in numpy_store._state.payloads) == [
+        "a",
+        "d",
+    ]
+
+    async def broken():
+        yield "a"
+        raise ValueError("corrupt document")
+
+    with pytest.raises(ValueError, match="corrupt document"):
+        await ingest.ingest_document(broken(), split_lines, "s3://a", 1, 8, "docx")
+
+
+async def test_pipeline_skips_near_duplicates(numpy_store):
+    disclaimer = "本文件仅供内部使用，未经许可不得外传，如有疑问请联系法务部。"
+
+    async def segments(texts):
+        for text in texts:
+            yield text
+
+    stats = await ingest.ingest_document(
+        segments([f"{disclaimer}\n年假规定\n{disclaimer}"]),
+        split_lines,
+        "s3://a",
+        1,
+        7,
+        "docx",
+    )
+    assert stats["points"] == 2
+    assert stats["duplicates"] == 1
+    assert stats["dedup_ratio"] == 1 / 3
+
+    # 其他文件中的重复块被跳过，重新导入同一文件时不受自身旧签名影响
+    stats = await ingest.ingest_document(
+        segments([f"{disclaimer}\n病假规定"]), split_lines, "s3://b", 1, 8, "docx"
+    )
+    assert stats["points"] == 1
+    stats = await ingest.ingest_document(
+        segments([f"{disclaimer}\n年假规定"]), split_lines, "s3://a", 1, 7, "docx"
+    )
+    assert stats["points"] == 2
+
+
+async def test_failed_ingest_does_not_register_signatures(numpy_store, monkeypatch):
+    policy = "员工出差产生的交通、住宿费用需在返回后五个工作日内提交报销申请。"
+
+    async def segments():
+        yield policy
+
+    async def failing_embed(self, texts):
+        raise RuntimeError("embedding unavailable")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(EmbeddingModel, "aembed_batch", failing_embed)
+        with pytest.raises(RuntimeError, match="embedding unavailable"):
+            await ingest.ingest_document(
+                segments(), split_lines, "s3://a", 1, 7, "docx"
+            )
+
+    stats = await ingest.ingest_document(
+        segments(), split_lines, "s3://b", 1, 8, "docx"
+    )
+    assert stats["points"] == 1
+    assert stats["duplicates"] == 0
+
+
+async def test_pipeline_writes_section_points_with_mean_vector(numpy_store):
+    section = Section(0, ("人事制度", "年假"), "## 年假\n年假第一句\n年假第二句")
+
+    def chunk(segment):
+        return [
+            LeafChunk(text, section.path, section) for text in segment.split("\n")[1:]
+        ]
+
+    async def segments():
+        yield section.text
+
+    stats = await ingest.ingest_document(segments(), chunk, "s3://a", 1, 7, "docx")
+    assert stats["points"] == 3 and stats["sections"] == 1
+
+    leaves = [p for p in numpy_store._state.payloads if p.get("kind") != "section"]
+    parent_id = leaves[0]["parent_id"]
+    assert all(p["parent_id"] == parent_id for p in leaves)
+    assert leaves[0]["section_path"] == ["人事制度", "年假"]
+    parent = (await numpy_store.retrieve([parent_id]))[parent_id]
+    assert parent["kind"] == "section" and parent["content"] == section.text
+
+    backend = HashingEmbeddingBackend(dim=64)
+    leaf_vectors = np.asarray(backend.embed_texts(["年假第一句", "年假第二句"]))
+    hits = await numpy_store.search(leaf_vectors.mean(axis=0).tolist(), user_id=1)
+    assert len(hits) == 2 and all("parent_id" in hit.payload for hit in hits)
+    expanded = await numpy_store.expand_sections(hits)
+    assert [hit.id for hit in expanded] == [parent_id]
@@ -0,0 +1,50 @@
+import asyncio
+import sys
+import time
+
+import pytest
+
+from app.core.process_pool import ConversionPool, ConversionTimeout
+
+
+@pytest.fixture
+def pool():
+    pool = ConversionPool(workers=1, timeout=10, memory_limit_mb=512)
+    yield pool
+    pool.shutdown()
+
+
+async def test_conversion_runs_in_worker_process(pool):
+    assert await pool.run(pow, 2, 10) == 1024
+    # 超出地址空间上限的分配在工作进程中失败，不影响进程池继续使用
+    with pytest.raises(MemoryError):
+        await pool.run(bytearray, 2 * 1024**3)
+    assert await pool.run(sum, [1, 2, 3]) == 6
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 14), reason="kill_workers requires Python 3.14"
+)
+async def test_timeout_restarts_pool(pool):
+    with pytest.raises(ConversionTimeout):
+        await pool.run(time.sleep, 5, timeout=0.5)
+    assert await pool.run(pow, 3, 2) == 9
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 14), reason="kill_workers requires Python 3.14"
+)
+async def test_timeout_resubmits_interrupted_jobs():
+    pool = ConversionPool(workers=2, timeout=10, memory_limit_mb=512)
+    try:
+        # 一个任务超时终止进程池，同时执行和排队的任务在新的进程池中完成
+        results = await asyncio.gather(
+            pool.run(time.sleep, 5, timeout=0.5),
+            pool.run(time.sleep, 1),
+            pool.run(pow, 2, 5),
+            return_exceptions=True,
+        )
+    finally:
+        pool.shutdown()
+    assert isinstance(results[0], ConversionTimeout)
+    assert results[1:] == [None, 32]
@@ -0,0 +1,375 @@
+import asyncio
+import random
+
+import pytest
+from loguru import logger
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import BinaryQuantization, PointStruct, ScalarQuantization
+
+from app.core.rag import qdrant_db
+from app.core.rag.qdrant_db import (
+    delete_stale_points,
+    qdrant_client_manager,
+    truncate_vector,
+    upsert_points_bulk,
+)
+from app.core.rag.vector_store import QdrantVectorStore, VectorRecord, make_point_id
+from app.schemas.retrieval import RetrievalOptions
+
+
+@pytest.fixture
+async def local_qdrant(monkeypatch):
+    """使用内存模式的Qdrant代替服务端"""
+    monkeypatch.setattr(qdrant_db, "QDRANT_COLLECTION_NAME", "test_collection")
+    qdrant_client_manager._client = AsyncQdrantClient(":memory:")
+    qdrant_client_manager.ready = False
+    yield qdrant_client_manager.get_client()
+    await qdrant_client_manager.close()
+
+
+def record_calls(monkeypatch, client, name):
+    """记录客户端方法的调用参数，调用仍交给内存模式执行"""
+    calls = []
+    method = getattr(client, name)
+
+    async def wrapper(*args, **kwargs):
+        calls.append(kwargs)
+        return await method(*args, **kwargs)
+
+    monkeypatch.setattr(client, name, wrapper)
+    return calls
+
+
+def make_points(user_id, file_id, chunks):
+    return [
+        PointStruct(
+            id=make_point_id(user_id, file_id, i, chunk),
+            vector=[random.random() for _ in range(qdrant_db.VECTOR_SIZE)],
+            payload={"content": chunk, "user_id": user_id, "file_id": file_id},
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def test_truncate_vector_is_normalized():
+    assert truncate_vector([3.0, 4.0, 100.0], dim=2) == [0.6, 0.8]
+
+
+async def test_reingest_replaces_stale_points(local_qdrant):
+    await upsert_points_bulk(make_points(1, 7, ["a", "b", "c"]), batch_size=2)
+    await upsert_points_bulk(make_points(1, 8, ["x"]))
+
+    points = make_points(1, 7, ["a", "b2"])
+    await upsert_points_bulk(points)
+    removed = await delete_stale_points(1, 7, [point.id for point in points])
+
+    assert removed == 2
+    result = await local_qdrant.scroll("test_collection", with_payload=True)
+    assert sorted(point.payload["content"] for point in result[0]) == ["a", "b2", "x"]
+
+
+async def test_hybrid_query_matches_exact_identifier(local_qdrant, monkeypatch):
+    monkeypatch.setattr(qdrant_db, "QDRANT_HYBRID", True)
+    monkeypatch.setattr(qdrant_client_manager, "hybrid", True)
+    await qdrant_client_manager.ensure_ready()
+
+    chunks = ["零件编号 A-7731 的库存", "年假申请流程", "报销说明"]
+    points = [
+        PointStruct(
+            id=make_point_id(1, 1, i, chunk),
+            vector=qdrant_db.build_point_vector(
+                [random.random() for _ in range(qdrant_db.VECTOR_SIZE)], chunk
+            ),
+            payload={"content": chunk, "user_id": 1},
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+    await upsert_points_bulk(points)
+
+    result = await local_qdrant.query_points(
+        "test_collection",
+        **qdrant_db.build_query_args(
+            [random.random() for _ in range(qdrant_db.VECTOR_SIZE)],
+            query_filter=None,
+            limit=3,
+            query_text="A-7731",
+        ),
+    )
+    assert result.points[0].payload["content"] == chunks[0]
+
+
+async def test_hybrid_score_threshold_applies_to_dense_candidates(
+    local_qdrant, monkeypatch
+):
+    monkeypatch.setattr(qdrant_db, "QDRANT_HYBRID", True)
+    monkeypatch.setattr(qdrant_client_manager, "hybrid", True)
+    await qdrant_client_manager.ensure_ready()
+
+    query = [1.0] * qdrant_db.VECTOR_SIZE
+    close = [[1.0 + 0.1 * i] + [1.0] * (qdrant_db.VECTOR_SIZE - 1) for i in range(3)]
+    chunks = ["年假申请流程", "病假申请流程", "报销说明", "设备归还"]
+    vectors = close + [[-1.0] * qdrant_db.VECTOR_SIZE]
+    points = [
+        PointStruct(
+            id=make_point_id(1, 1, i, chunk),
+            vector=qdrant_db.build_point_vector(vector, chunk),
+            payload={"content": chunk, "user_id": 1},
+        )
+        for i, (chunk, vector) in enumerate(zip(chunks, vectors))
+    ]
+    await upsert_points_bulk(points)
+
+    result = await local_qdrant.query_points(
+        "test_collection",
+        **qdrant_db.build_query_args(
+            query,
+            query_filter=None,
+            limit=3,
+            query_text="流程",
+            options=RetrievalOptions(score_threshold=0.5),
+        ),
+    )
+    # 阈值只过滤稠密召回的低相似度候选，排名靠后的融合结果不会因RRF得分低被丢弃
+    assert sorted(point.payload["content"] for point in result.points) == sorted(
+        chunks[:3]
+    )
+
+
+async def test_first_upsert_waits_for_collection_init(local_qdrant, monkeypatch):
+    # 已有集合没有稀疏向量，进程启动后的首次写入应在初始化关闭混合检索之后生成点向量
+    await qdrant_client_manager.ensure_ready()
+    qdrant_client_manager.ready = False
+    monkeypatch.setattr(qdrant_db, "QDRANT_HYBRID", True)
+    monkeypatch.setattr(qdrant_client_manager, "hybrid", True)
+
+    record = VectorRecord(
+        id=make_point_id(1, 1, 0, "a"),
+        vector=[random.random() for _ in range(qdrant_db.VECTOR_SIZE)],
+        payload={"content": "a", "user_id": 1, "file_id": 1},
+    )
+    await QdrantVectorStore().upsert([record])
+    assert not qdrant_client_manager.hybrid
+    assert (await local_qdrant.count("test_collection")).count == 1
+
+
+def test_retrieval_options_override_defaults():
+    assert qdrant_db.build_search_params() is None
+    params = qdrant_db.build_search_params(RetrievalOptions(hnsw_ef=128))
+    assert params.hnsw_ef == 128 and not params.exact
+    args = qdrant_db.build_query_args(
+        [0.1, 0.2], None, 5, options=RetrievalOptions(score_threshold=0.3)
+    )
+    assert args["score_threshold"] == 0.3
+    assert qdrant_db.resolve_option(RetrievalOptions(), "limit") == (
+        qdrant_db.RETRIEVAL_LIMIT
+    )
+
+
+async def test_sections_are_excluded_from_search_and_expanded(
+    local_qdrant, monkeypatch
+):
+    monkeypatch.setattr(qdrant_db, "QDRANT_HYBRID", True)
+    monkeypatch.setattr(qdrant_client_manager, "hybrid", True)
+    await qdrant_client_manager.ensure_ready()
+
+    vector = [1.0] + [0.0] * (qdrant_db.VECTOR_SIZE - 1)
+    section = VectorRecord(
+        id=make_point_id(1, 1, 0, "section"),
+        vector=vector,
+        payload={"content": "# 年假\n\n全文", "user_id": 1, "kind": "section"},
+    )
+    leaf = VectorRecord(
+        id=make_point_id(1, 1, 0, "leaf"),
+        vector=vector,
+        payload={"content": "年假", "user_id": 1, "parent_id": section.id},
+    )
+    store = QdrantVectorStore()
+    await store.upsert([section, leaf])
+
+    hits = await store.search(vector, user_id=1, query_text="年假")
+    assert [hit.id for hit in hits] == [leaf.id]
+    expanded = await store.expand_sections(hits)
+    assert [hit.payload["content"] for hit in expanded] == ["# 年假\n\n全文"]
+
+
+async def wait_until(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met in time")
+
+
+async def test_check_reports_missing_collection(local_qdrant):
+    await qdrant_client_manager.ensure_ready()
+    assert await qdrant_client_manager.check()
+
+    await local_qdrant.delete_collection("test_collection")
+    assert not await qdrant_client_manager.check()
+    assert not qdrant_client_manager.ready
+    assert "does not exist" in qdrant_client_manager.last_error
+
+    # 没有后台任务时请求当场重新初始化
+    await qdrant_client_manager.get_ready_client()
+    assert await local_qdrant.collection_exists("test_collection")
+
+
+async def test_requests_fail_fast_while_monitor_reconnects(local_qdrant, monkeypatch):
+    monkeypatch.setattr(qdrant_db, "QDRANT_RECONNECT_INTERVAL", 0.05)
+    monkeypatch.setattr(qdrant_db, "QDRANT_HEALTH_CHECK_INTERVAL", 0.05)
+    # 不可达的地址模拟Qdrant宕机
+    qdrant_client_manager._client = AsyncQdrantClient(
+        url="http://127.0.0.1:1", timeout=1, check_compatibility=False
+    )
+    qdrant_client_manager.start()
+    await wait_until(lambda: qdrant_client_manager.last_error is not None)
+    with pytest.raises(qdrant_db.QdrantUnavailableError):
+        await qdrant_client_manager.get_ready_client()
+
+    # Qdrant恢复后后台任务完成重连
+    await qdrant_client_manager._client.close()
+    qdrant_client_manager._client = local_qdrant
+    await wait_until(lambda: qdrant_client_manager.ready)
+    assert await qdrant_client_manager.get_ready_client() is local_qdrant
+
+    # 集合被删除后探活发现未就绪，后台任务重建集合
+    await local_qdrant.delete_collection("test_collection")
+    for _ in range(500):
+        if await local_qdrant.collection_exists("test_collection"):
+            break
+        await asyncio.sleep(0.01)
+    await wait_until(lambda: qdrant_client_manager.ready)
+
+
+def test_quantization_config_from_settings(monkeypatch):
+    monkeypatch.setattr(qdrant_db, "QDRANT_QUANTIZATION", "none")
+    assert qdrant_db.build_quantization_config() is None
+
+    monkeypatch.setattr(qdrant_db, "QDRANT_QUANTIZATION", "binary")
+    assert isinstance(qdrant_db.build_quantization_config(), BinaryQuantization)
+
+    monkeypatch.setattr(qdrant_db, "QDRANT_QUANTIZATION", "scalar")
+    assert isinstance(qdrant_db.build_quantization_config(), ScalarQuantization)
+    # 启用量化时检索默认用原始向量重打分
+    params = qdrant_db.build_search_params()
+    assert params.quantization.rescore
+    assert params.quantization.oversampling == qdrant_db.QDRANT_OVERSAMPLING
+
+    monkeypatch.setattr(qdrant_db, "QDRANT_QUANTIZATION", "pq")
+    with pytest.raises(ValueError):
+        qdrant_db.build_quantization_config()
+
+
+def test_client_args_for_rest_and_grpc():
+    rest = qdrant_db.build_client_args(prefer_grpc=False)
+    assert rest["limits"].max_connections == qdrant_db.QDRANT_POOL_SIZE
+    assert "grpc_options" not in rest
+
+    grpc = qdrant_db.build_client_args(prefer_grpc=True)
+    assert grpc["pool_size"] == qdrant_db.QDRANT_GRPC_POOL_SIZE
+    assert grpc["grpc_options"]["grpc.max_send_message_length"] == (
+        qdrant_db.QDRANT_GRPC_MAX_MESSAGE_MB * 1024 * 1024
+    )
+    assert "limits" not in grpc
+
+
+async def test_collection_created_with_storage_settings(local_qdrant, monkeypatch):
+    monkeypatch.setattr(qdrant_db, "QDRANT_HNSW_M", 32)
+    monkeypatch.setattr(qdrant_db, "QDRANT_HNSW_EF_CONSTRUCT", 200)
+    monkeypatch.setattr(qdrant_db, "QDRANT_QUANTIZATION", "scalar")
+    monkeypatch.setattr(qdrant_db, "QDRANT_ON_DISK_VECTORS", True)
+    created = record_calls(monkeypatch, local_qdrant, "create_collection")
+    indexed = record_calls(monkeypatch, local_qdrant, "create_payload_index")
+
+    await qdrant_client_manager.ensure_ready()
+
+    # 内存模式不保存HNSW、量化和载荷索引配置，只能检查发给客户端的参数
+    (args,) = created
+    assert args["hnsw_config"].m == 32
+    assert args["hnsw_config"].ef_construct == 200
+    assert isinstance(args["quantization_config"], ScalarQuantization)
+    assert args["vectors_config"].on_disk
+    assert {call["field_name"]: call["field_schema"] for call in indexed} == (
+        qdrant_db.PAYLOAD_INDEXES
+    )
+
+
+async def test_outdated_collection_is_reported_or_migrated(local_qdrant, monkeypatch):
+    await qdrant_client_manager.ensure_ready()
+    monkeypatch.setattr(qdrant_db, "QDRANT_HNSW_M", 32)
+    updated = record_calls(monkeypatch, local_qdrant, "update_collection")
+    errors = []
+    handler = logger.add(errors.append, level="ERROR", format="{message}")
+    try:
+        qdrant_client_manager.ready = False
+        await qdrant_client_manager.ensure_ready()
+    finally:
+        logger.remove(handler)
+
+    # 未开启自动迁移时继续使用已有集合，并以错误级别提示配置未生效
+    assert qdrant_client_manager.ready
+    assert any("storage settings differ" in message for message in errors)
+    assert not updated
+
+    monkeypatch.setattr(qdrant_db, "QDRANT_AUTO_MIGRATE", True)
+    qdrant_client_manager.ready = False
+    await qdrant_client_manager.ensure_ready()
+    (args,) = updated
+    assert args["hnsw_config"].m == 32
+
+
+async def test_readiness_transitions(local_qdrant):
+    assert not qdrant_client_manager.ready
+    await qdrant_client_manager.ensure_ready()
+    assert qdrant_client_manager.ready
+    assert qdrant_client_manager.last_error is None
+
+    await qdrant_client_manager.close()
+    assert not qdrant_client_manager.ready
+
+    # 初始化失败时保持未就绪并记录原因
+    qdrant_client_manager._client = AsyncQdrantClient(
+        url="http://127.0.0.1:1", timeout=1, check_compatibility=False
+    )
+    with pytest.raises(Exception):
+        await qdrant_client_manager.ensure_ready()
+    assert not qdrant_client_manager.ready
+    assert qdrant_client_manager.last_error
+
+
+async def test_bulk_upsert_reports_batches(local_qdrant):
+    stats = await upsert_points_bulk(
+        make_points(1, 1, ["a", "b", "c", "d", "e"]), batch_size=2, parallel=2
+    )
+
+    assert stats["points"] == 5
+    assert stats["batches"] == 3
+    assert (await local_qdrant.count("test_collection")).count == 5
+
+
+async def test_two_stage_query_rescores_prefetched_candidates(
+    local_qdrant, monkeypatch
+):
+    monkeypatch.setattr(qdrant_db, "QDRANT_TWO_STAGE", True)
+    await qdrant_client_manager.ensure_ready()
+
+    vectors = [
+        [random.random() for _ in range(qdrant_db.VECTOR_SIZE)] for _ in range(5)
+    ]
+    points = [
+        PointStruct(
+            id=make_point_id(1, 1, i, str(i)),
+            vector=qdrant_db.build_point_vector(vector),
+            payload={"content": str(i), "user_id": 1},
+        )
+        for i, vector in enumerate(vectors)
+    ]
+    await upsert_points_bulk(points)
+
+    args = qdrant_db.build_query_args(vectors[3], query_filter=None, limit=2)
+    # 第一阶段用截断后的低维向量召回更多候选
+    assert args["prefetch"].using == qdrant_db.PREFETCH_VECTOR_NAME
+    assert len(args["prefetch"].query) == qdrant_db.QDRANT_PREFETCH_DIM
+    assert args["prefetch"].limit == 2 * qdrant_db.QDRANT_PREFETCH_MULTIPLIER
+    result = await local_qdrant.query_points("test_collection", **args)
+    assert result.points[0].payload["content"] == "3"
@@ -0,0 +1,137 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.scheduler import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    ModelCallScheduler,
+    TokenBucket,
+)
+
+
+class FakeStatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def make_scheduler(**kwargs):
+    options = dict(max_retries=3, backoff_base=0.001, backoff_max=0.01)
+    options.update(kwargs)
+    return ModelCallScheduler("test", **options)
+
+
+async def test_retries_rate_limited_calls():
+    scheduler = make_scheduler(max_concurrency=8)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise FakeStatusError(429)
+        return "ok"
+
+    assert await scheduler.run(call) == "ok"
+    assert len(attempts) == 3
+    assert scheduler.rate_limited == 2
+    # 两次限流后并发上限减半两次
+    assert scheduler.limiter.limit < 8
+
+
+async def test_retry_after_is_capped_by_backoff_max():
+    scheduler = make_scheduler(backoff_max=0.05)
+    assert scheduler._backoff(0, FakeStatusError(429, {"retry-after": "0.02"})) == 0.02
+    assert scheduler._backoff(0, FakeStatusError(429, {"retry-after": "3600"})) == 0.05
+
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise FakeStatusError(429, {"retry-after": "3600"})
+        return "ok"
+
+    start = time.monotonic()
+    assert await scheduler.run(call) == "ok"
+    assert time.monotonic() - start < 1
+
+
+async def test_client_errors_are_not_retried():
+    scheduler = make_scheduler()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise FakeStatusError(400)
+
+    with pytest.raises(FakeStatusError):
+        await scheduler.run(call)
+    assert len(attempts) == 1
+
+
+async def test_circuit_breaker_opens_after_failures():
+    scheduler = make_scheduler(max_retries=3, breaker_threshold=2, breaker_reset=0.1)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise FakeStatusError(503)
+
+    start = time.monotonic()
+    with pytest.raises(FakeStatusError):
+        await scheduler.run(call)
+    # 熔断后重试等到半开再继续，而不是立即失败
+    assert len(attempts) == 4
+    assert time.monotonic() - start >= 0.1
+    assert scheduler.breaker.state == "open"
+
+    # 熔断期间新的调用直接拒绝
+    with pytest.raises(CircuitOpenError):
+        await scheduler.run(call)
+    assert len(attempts) == 4
+
+
+async def test_rate_limit_burst_does_not_open_breaker():
+    scheduler = make_scheduler(max_retries=10, breaker_threshold=2, breaker_reset=60)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) <= 5:
+            raise FakeStatusError(429)
+        return "ok"
+
+    assert await scheduler.run(call) == "ok"
+    assert scheduler.rate_limited == 5
+    assert scheduler.breaker.state == "closed"
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_aimd_limits():
+    limiter = AdaptiveConcurrencyLimiter(max_limit=4, target_latency=1)
+    limiter.on_overload()
+    assert limiter.limit == 2
+    limiter.on_success(0.1)
+    assert 2 < limiter.limit <= 4
+    limiter.on_success(5)
+    assert limiter.limit < 2
+
+
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=600)
+    await bucket.acquire(600)
+    start = time.monotonic()
+    await bucket.acquire(2)
+    assert time.monotonic() - start >= 0.15
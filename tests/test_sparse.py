@@ -0,0 +1,25 @@
+from app.core.rag.sparse import encode_document, encode_query, token_index, tokenize
+
+
+def test_tokenize_chinese_and_identifiers():
+    tokens = tokenize("年假申请 SKU-1024")
+    assert {"年", "假", "年假", "假申", "申请"} <= set(tokens)
+    assert {"sku-1024", "sku", "1024"} <= set(tokens)
+
+
+def test_tokenize_normalizes_width_and_case():
+    assert tokenize("ＡＢ１２") == tokenize("ab12") == ["ab12"]
+
+
+def test_document_weights_saturate_with_term_frequency():
+    vector = encode_document("库存 库存 库存 单价")
+    weights = dict(zip(vector.indices, vector.values))
+    assert weights[token_index("库存")] > weights[token_index("单价")]
+    assert weights[token_index("库存")] < 3 * weights[token_index("单价")]
+    assert vector.indices == sorted(vector.indices)
+
+
+def test_query_weights():
+    vector = encode_query("SKU-1024 SKU-1024")
+    assert vector.values == [1.0] * len(vector.indices)
+    assert token_index("sku-1024") in vector.indices
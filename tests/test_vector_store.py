@@ -0,0 +1,83 @@
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from app.core.rag.vector_store import NumpyVectorStore, VectorRecord, make_point_id
+
+
+def make_records(user_id, file_id, vectors):
+    return [
+        VectorRecord(
+            id=make_point_id(user_id, file_id, i, str(vector)),
+            vector=vector,
+            payload={"content": str(vector), "user_id": user_id, "file_id": file_id},
+        )
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def test_point_id_is_deterministic():
+    assert make_point_id(1, 2, 0, "年假") == make_point_id(1, 2, 0, "年假")
+    assert make_point_id(1, 2, 0, "年假") != make_point_id(1, 2, 0, "病假")
+    assert make_point_id(1, 2, 0, "年假") != make_point_id(1, 3, 0, "年假")
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+async def test_numpy_store_search_is_scoped_to_user(tmp_path, dtype):
+    store = NumpyVectorStore(path=str(tmp_path), dtype=dtype)
+    await store.upsert(make_records(2, 1, [[0.0, 1.0], [1.0, 0.0]]))
+    await store.upsert(make_records(1, 1, [[1.0, 0.1], [0.0, 1.0], [1.0, 1.0]]))
+
+    hits = await store.search([1.0, 0.0], user_id=1)
+    assert [hit.payload["content"] for hit in hits] == [
+        "[1.0, 0.1]",
+        "[1.0, 1.0]",
+        "[0.0, 1.0]",
+    ]
+    assert all(hit.payload["user_id"] == 1 for hit in hits)
+    assert np.isclose(hits[0].score, 1 / np.sqrt(1.01), atol=1e-3)
+    assert await store.search([1.0, 0.0], user_id=3) == []
+
+
+async def test_numpy_store_persists_and_replaces_stale(tmp_path):
+    store = NumpyVectorStore(path=str(tmp_path))
+    await store.upsert(make_records(1, 7, [[1.0, 0.0], [0.0, 1.0]]))
+    await store.upsert(make_records(1, 8, [[1.0, 1.0]]))
+
+    records = make_records(1, 7, [[1.0, 0.0]])
+    await store.upsert(records)
+    assert await store.delete_stale(1, 7, [record.id for record in records]) == 1
+
+    reloaded = NumpyVectorStore(path=str(tmp_path))
+    hits = await reloaded.search([1.0, 0.0], user_id=1)
+    assert sorted(hit.payload["file_id"] for hit in hits) == [7, 8]
+
+
+def test_numpy_store_search_reads_a_consistent_snapshot(tmp_path):
+    store = NumpyVectorStore(path=str(tmp_path))
+    done = threading.Event()
+
+    def write():
+        # 交替写入两个用户，每次写入都会改变行的排列
+        for i in range(30):
+            store._upsert(make_records(i % 2 + 1, i, [[1.0, float(i)]]))
+        done.set()
+
+    # 缩短线程切换间隔，让检索更容易落在写入发布新数据的中途
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not done.is_set():
+            for hit in store.search_sync([1.0, 0.0], user_id=1, limit=50):
+                payload = hit.payload
+                assert payload["user_id"] == 1
+                assert hit.id == make_point_id(
+                    1, payload["file_id"], 0, payload["content"]
+                )
+        writer.join()
+    finally:
+        sys.setswitchinterval(interval)